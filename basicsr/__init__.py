@@ -1,9 +1,19 @@
-
 # flake8: noqa
-from .archs import *
-from .data import *
-from .losses import *
-from .metrics import *
-from .models import *
-from .ops import *
+import importlib
+
 from .version import __gitsha__, __version__
+
+# The sub-packages are imported on first access, so that e.g.
+# ``from basicsr.utils import ...`` does not pull in torchvision, pyiqa and
+# the like. The registries import their modules on first lookup.
+_SUBPACKAGES = ('archs', 'data', 'losses', 'metrics', 'models', 'ops')
+
+
+def __getattr__(name):
+    if name in _SUBPACKAGES:
+        return importlib.import_module(f'{__name__}.{name}')
+    for subpackage in _SUBPACKAGES:
+        module = importlib.import_module(f'{__name__}.{subpackage}')
+        if name in getattr(module, '__all__', ()):
+            return getattr(module, name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
@@ -1,4 +1,3 @@
-import importlib
 from copy import deepcopy
 from os import path as osp
 
@@ -12,8 +11,9 @@ __all__ = ['build_network']
 # '_arch.py'
 arch_folder = osp.dirname(osp.abspath(__file__))
 arch_filenames = [osp.splitext(osp.basename(v))[0] for v in scandir(arch_folder) if v.endswith('_arch.py')]
-# import all the arch modules
-_arch_modules = [importlib.import_module(f'basicsr.archs.{file_name}') for file_name in arch_filenames]
+# register the arch modules lazily, they are imported on first use
+for file_name in arch_filenames:
+    ARCH_REGISTRY.register_lazy(f'basicsr.archs.{file_name}', osp.join(arch_folder, f'{file_name}.py'))
 
 
 def build_network(opt):
@@ -2,6 +2,7 @@ import math
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint, checkpoint_sequential
 from basicsr.archs.lednet_submodules import *
 from basicsr.utils.registry import ARCH_REGISTRY
 import functools
@@ -138,11 +139,17 @@ class Encoder_patch66(nn.Module):
         self.count = 0
         self.center_example = None
         self.center_coordinate = None
+        # recompute the activations of each layer in backward, set by Net
+        self.use_checkpoint = False
 
     def forward(self, src_fea, src_location, return_attns=False, src_mask=None):
         enc_output = src_fea
+        use_checkpoint = self.use_checkpoint and self.training and torch.is_grad_enabled()
         for enc_layer in self.layer_stack:
-            enc_output, enc_slf_attn = enc_layer(enc_output, slf_attn_mask=src_mask)
+            if use_checkpoint:
+                enc_output, enc_slf_attn = checkpoint(enc_layer, enc_output, src_mask, use_reentrant=False)
+            else:
+                enc_output, enc_slf_attn = enc_layer(enc_output, slf_attn_mask=src_mask)
         return enc_output
 
 
@@ -286,10 +293,81 @@ class eca_layer(nn.Module):
         return x * y.expand_as(x)
 
 
+def patch_unfold(x, patch_size):
+    """Split a feature map into non-overlapping patches, the same as
+    ``F.unfold(x, patch_size, stride=patch_size).permute(0, 2, 1)``.
+
+    Unfolding without overlap is a pure reshape, so it is one permuted copy
+    from either memory format (NCHW or channels_last), instead of an im2col
+    followed by a transposition.
+
+    Args:
+        x (Tensor): Input with shape (b, c, h, w). The rows and columns that do
+            not fill a whole patch are dropped.
+        patch_size (int): Patch size.
+
+    Returns:
+        Tensor: Patches with shape (b, num_patches, c * patch_size**2).
+    """
+    b, c, h, w = x.shape
+    ph, pw = h // patch_size, w // patch_size
+    x = x[:, :, :ph * patch_size, :pw * patch_size].view(b, c, ph, patch_size, pw, patch_size)
+    return x.permute(0, 2, 4, 1, 3, 5).reshape(b, ph * pw, c * patch_size * patch_size)
+
+
+def patch_fold(x, output_size, patch_size, channels_last=False):
+    """Inverse of :func:`patch_unfold`, the same as ``nn.Fold`` with
+    ``stride=patch_size``.
+
+    Args:
+        x (Tensor): Patches with shape (b, num_patches, c * patch_size**2).
+        output_size (tuple[int]): (h, w) of the feature map. The rows and
+            columns not covered by a patch are zero.
+        patch_size (int): Patch size.
+        channels_last (bool): Write the output in channels_last memory
+            format. Default: False.
+
+    Returns:
+        Tensor: Feature map with shape (b, c, h, w).
+    """
+    b, _, dim = x.shape
+    h, w = output_size
+    ph, pw = h // patch_size, w // patch_size
+    x = x.reshape(b, ph, pw, dim // (patch_size * patch_size), patch_size, patch_size)
+    if channels_last:
+        # (b, ph, patch, pw, patch, c) is the memory order of NHWC
+        x = x.permute(0, 1, 4, 2, 5, 3).reshape(b, ph * patch_size, pw * patch_size, -1).permute(0, 3, 1, 2)
+    else:
+        x = x.permute(0, 3, 1, 4, 2, 5).reshape(b, -1, ph * patch_size, pw * patch_size)
+    if ph * patch_size != h or pw * patch_size != w:
+        x = F.pad(x, (0, w - pw * patch_size, 0, h - ph * patch_size))
+    return x
+
 
 @ARCH_REGISTRY.register()
 class Net(nn.Module):
-    def __init__(self, channels=[32, 64, 128, 128], front_RBs=5, back_RBs=10, connection=False):
+    """SNR-aware low-light enhancement network.
+
+    Args:
+        checkpoint (list[str] | None): Block groups whose activations are
+            recomputed in backward (activation checkpointing) to save memory
+            in training. Supported: 'ppm', 'feature_extraction',
+            'transformer' and 'recon_trunk'. Default: None.
+        channels_last (bool): Run the convs in channels_last (NHWC) memory
+            format, which is faster on recent CPUs and GPUs. The conv weights
+            are converted, and the input is converted in forward.
+            Default: False.
+    """
+
+    checkpoint_groups = ('ppm', 'feature_extraction', 'transformer', 'recon_trunk')
+
+    def __init__(self,
+                 channels=[32, 64, 128, 128],
+                 front_RBs=5,
+                 back_RBs=10,
+                 connection=False,
+                 checkpoint=None,
+                 channels_last=False):
         super(Net, self).__init__()
         [ch1, ch2, ch3, ch4] = channels
         nf = ch2
@@ -324,24 +402,54 @@ class Net(nn.Module):
         self.fca_edge = eca_layer(channel=nf)
         self.fca_fre = eca_layer(channel=nf)
 
-
+        self.set_checkpoint(checkpoint)
+
+        self.channels_last = channels_last
+        if channels_last:
+            self.to(memory_format=torch.channels_last)
+
+    def set_checkpoint(self, groups):
+        """Select the block groups that use activation checkpointing.
+
+        Args:
+            groups (list[str] | None): See the ``checkpoint`` argument.
+        """
+        groups = set(groups or [])
+        unknown = groups - set(self.checkpoint_groups)
+        if unknown:
+            raise ValueError(f'Unknown checkpoint groups: {sorted(unknown)}. '
+                             f'Supported ones are {self.checkpoint_groups}.')
+        self.checkpoint_set = groups
+        self.transformer.use_checkpoint = 'transformer' in groups
+
+    def _ckpt_call(self, group, module, x):
+        """Call a block, recomputing it in backward if its group is
+        checkpointed."""
+        if group not in self.checkpoint_set or not (self.training and torch.is_grad_enabled()):
+            return module(x)
+        if isinstance(module, nn.Sequential):
+            # one segment per residual block
+            return checkpoint_sequential(module, len(module), x, use_reentrant=False)
+        return checkpoint(module, x, use_reentrant=False)
 
     def forward(self, x, mask, side_loss=False):
 
         x_center = x
+        if self.channels_last:
+            x_center = x.contiguous(memory_format=torch.channels_last)
 
         ### The encoder of our framework has three convolution layers (i.e., strides 1, 2, and 2) with one residual block after the encoder.
 
         L1_fea_1 = self.lrelu(self.conv_first_1(x_center)) # 512*960
-        L1_fea_1 = self.PPM1(L1_fea_1)
+        L1_fea_1 = self._ckpt_call('ppm', self.PPM1, L1_fea_1)
 
         L1_fea_2 = self.lrelu(self.conv_first_2(L1_fea_1)) # downsample to 256*480
-        L1_fea_2 = self.PPM2(L1_fea_2)
+        L1_fea_2 = self._ckpt_call('ppm', self.PPM2, L1_fea_2)
 
         L1_fea_3 = self.lrelu(self.conv_first_3(L1_fea_2)) # downsample to 128*240
-        L1_fea_3 = self.PPM3(L1_fea_3)
+        L1_fea_3 = self._ckpt_call('ppm', self.PPM3, L1_fea_3)
 
-        fea = self.feature_extraction(L1_fea_3)  # feature_extraction
+        fea = self._ckpt_call('feature_extraction', self.feature_extraction, L1_fea_3)  # feature_extraction
 
         fea_light = self.mcp(fea)  # short-range branch
         feature_edge_m = self.conv_edge(fea_light)
@@ -360,7 +468,7 @@ class Net(nn.Module):
         ys = np.linspace(-1, 1, fea.size(2) // 4)
         xs = np.meshgrid(xs, ys)                   # 灏唜s涓瘡涓€涓暟鎹拰ys涓瘡涓€涓暟鎹粍鍚堢敓鎴愬緢澶氱偣,鐒跺悗灏嗚繖浜涚偣鐨剎鍧愭爣鏀惧叆鍒癤涓?y鍧愭爣鏀惧叆Y涓?骞朵笖鐩稿簲浣嶇疆鏄搴旂殑 xs*ys=60*32=1920
         xs = np.stack(xs, 2)
-        xs = torch.Tensor(xs).unsqueeze(0).repeat(fea.size(0), 1, 1, 1).cuda()
+        xs = torch.Tensor(xs).unsqueeze(0).repeat(fea.size(0), 1, 1, 1).to(fea.device)
         xs = xs.view(fea.size(0), -1, 2)
 
 
@@ -368,18 +476,15 @@ class Net(nn.Module):
 
         height = fea.shape[2]
         width = fea.shape[3]
-        fea_unfold = F.unfold(fea, kernel_size=4, dilation=1, stride=4, padding=0)
-        fea_unfold = fea_unfold.permute(0, 2, 1)
+        fea_unfold = patch_unfold(fea, 4)
 
 
-        mask_unfold = F.unfold(mask, kernel_size=4, dilation=1, stride=4, padding=0)  # unfold the mask
-        mask_unfold = mask_unfold.permute(0, 2, 1)
+        mask_unfold = patch_unfold(mask, 4)  # unfold the mask
         mask_unfold = torch.mean(mask_unfold, dim=2).unsqueeze(dim=-2)  # compute the average value in each patch
         mask_unfold[mask_unfold <= 0.5] = 0.0
 
         fea_unfold = self.transformer(fea_unfold, xs, src_mask=mask_unfold)
-        fea_unfold = fea_unfold.permute(0, 2, 1)
-        fea_unfold = nn.Fold(output_size=(height, width), kernel_size=(4, 4), stride=4, padding=0, dilation=1)(fea_unfold)
+        fea_unfold = patch_fold(fea_unfold, (height, width), 4, channels_last=self.channels_last)
 
 
         ### SNR-based Spatially-varying Feature Fusion
@@ -396,7 +501,7 @@ class Net(nn.Module):
         fea = fea_unfold + edge_attention + fre_attention
 
         ### decoder/ conv and skip connection and unsample by pixel_shuffle
-        out_noise = self.recon_trunk(fea)
+        out_noise = self._ckpt_call('recon_trunk', self.recon_trunk, fea)
         out_noise = torch.cat([out_noise, L1_fea_3], dim=1)
         out_noise = self.lrelu(self.pixel_shuffle(self.upconv1(out_noise)))
         out_noise = torch.cat([out_noise, L1_fea_2], dim=1)
@@ -480,9 +585,8 @@ class MultiSpectralDCTLayer(nn.Module):
         assert len(x.shape) == 4, 'x must been 4 dimensions, but got ' + str(len(x.shape))
         # n, c, h, w = x.shape
 
-        x = x * self.weight
-
-        result = torch.sum(x, dim=[2, 3])
+        # sum of x * weight over h and w, without materializing the product
+        result = torch.einsum('nchw,chw->nc', x, self.weight)
         return result
 
     def build_filter(self, pos, freq, POS):
@@ -493,18 +597,34 @@ class MultiSpectralDCTLayer(nn.Module):
             return result * math.sqrt(2)
 
     def get_dct_filter(self, tile_size_x, tile_size_y, mapper_x, mapper_y, channel):
-        dct_filter = torch.zeros(channel, tile_size_x, tile_size_y)
+        # cached, and cloned as the buffer may be modified in place
+        return _dct_filter(tile_size_x, tile_size_y, tuple(mapper_x), tuple(mapper_y), channel).clone()
+
+
+def _dct_basis(size, freqs):
+    """1D DCT basis, the same as ``MultiSpectralDCTLayer.build_filter``.
+
+    Returns:
+        Tensor: Shape (len(freqs), size), float64.
+    """
+    # on the CPU explicitly, as the result is cached across default devices
+    # (e.g., a net built under ``torch.device('meta')``)
+    pos = torch.arange(size, dtype=torch.float64, device='cpu')
+    freqs = torch.tensor(freqs, dtype=torch.float64, device='cpu')[:, None]
+    basis = torch.cos(math.pi * freqs * (pos + 0.5) / size) / math.sqrt(size)
+    return torch.where(freqs == 0, basis, basis * math.sqrt(2))
 
-        c_part = channel // len(mapper_x)
 
-        for i, (u_x, v_y) in enumerate(zip(mapper_x, mapper_y)):
-            for t_x in range(tile_size_x):
-                for t_y in range(tile_size_y):
-                    dct_filter[i * c_part: (i + 1) * c_part, t_x, t_y] = self.build_filter(t_x, u_x,
-                                                                                           tile_size_x) * self.build_filter(
-                        t_y, v_y, tile_size_y)
+@functools.lru_cache(maxsize=None)
+def _dct_filter(tile_size_x, tile_size_y, mapper_x, mapper_y, channel):
+    """DCT filters of all the channels: the outer product of the 1D bases of
+    each frequency, repeated over its channel part.
 
-        return dct_filter
+    Returns:
+        Tensor: Shape (channel, tile_size_x, tile_size_y), float32.
+    """
+    dct_filter = _dct_basis(tile_size_x, mapper_x)[:, :, None] * _dct_basis(tile_size_y, mapper_y)[:, None, :]
+    return dct_filter.float().repeat_interleave(channel // len(mapper_x), dim=0)
 
 
 def get_freq_indices(method):
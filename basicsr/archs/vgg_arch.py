@@ -121,6 +121,14 @@ class VGGFeatureExtractor(nn.Module):
             else:
                 modified_net[k] = v
 
+        # the in-place ReLU right after a requested layer would overwrite its
+        # output, so make it out-of-place instead of cloning every output
+        keys = list(modified_net.keys())
+        for k, k_next in zip(keys[:-1], keys[1:]):
+            layer = modified_net[k_next]
+            if k in layer_name_list and isinstance(layer, nn.ReLU) and layer.inplace:
+                modified_net[k_next] = nn.ReLU(inplace=False)
+
         self.vgg_net = nn.Sequential(modified_net)
 
         if not requires_grad:
@@ -156,6 +164,6 @@ class VGGFeatureExtractor(nn.Module):
         for key, layer in self.vgg_net._modules.items():
             x = layer(x)
             if key in self.layer_name_list:
-                output[key] = x.clone()
+                output[key] = x
 
         return output
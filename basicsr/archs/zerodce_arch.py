@@ -28,7 +28,8 @@ class ConditionZeroDCE(nn.Module):
 		self.e_conv_e4 = nn.Conv2d(ch_n, ch_n, 3, 1, 1, bias=True)  
    
 	def forward(self, x, e):
-		E_x = e.repeat(x.shape[0],1,1,1) 
+		# e is either a single exposure map shared by the batch or one map per sample
+		E_x = e if e.shape[0] == x.shape[0] else e.repeat(x.shape[0],1,1,1)
 		E_x1 = self.relu(self.e_conv_e1(E_x))
 		E_x2 = self.relu(self.e_conv_e2(E_x1))
 		E_x3 = self.relu(self.e_conv_e3(E_x2))
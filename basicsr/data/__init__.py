@@ -1,4 +1,3 @@
-import importlib
 import numpy as np
 import random
 import torch
@@ -7,8 +6,10 @@ from copy import deepcopy
 from functools import partial
 from os import path as osp
 
+from basicsr.data.data_sampler import BucketBatchSampler, bucket_collate_fn
 from basicsr.data.prefetch_dataloader import PrefetchDataLoader
 from basicsr.utils import get_root_logger, scandir
+from basicsr.utils.dir_index import DirectoryIndex, read_image_sizes
 from basicsr.utils.dist_util import get_dist_info
 from basicsr.utils.registry import DATASET_REGISTRY
 
@@ -18,8 +19,9 @@ __all__ = ['build_dataset', 'build_dataloader']
 # scan all the files under the data folder with '_dataset' in file names
 data_folder = osp.dirname(osp.abspath(__file__))
 dataset_filenames = [osp.splitext(osp.basename(v))[0] for v in scandir(data_folder) if v.endswith('_dataset.py')]
-# import all the dataset modules
-_dataset_modules = [importlib.import_module(f'basicsr.data.{file_name}') for file_name in dataset_filenames]
+# register the dataset modules lazily, they are imported on first use
+for file_name in dataset_filenames:
+    DATASET_REGISTRY.register_lazy(f'basicsr.data.{file_name}', osp.join(data_folder, f'{file_name}.py'))
 
 
 def build_dataset(dataset_opt):
@@ -46,6 +48,12 @@ def build_dataloader(dataset, dataset_opt, num_gpu=1, dist=False, sampler=None,
             phase (str): 'train' or 'val'.
             num_worker_per_gpu (int): Number of workers for each GPU.
             batch_size_per_gpu (int): Training batch size for each GPU.
+            bucket_batch_size (int): Batch size for validation / test. If
+                set, images are batched by their size with
+                BucketBatchSampler. Default: None (batch size 1).
+            bucket_step (int): Bucket granularity in pixels. Default: 8.
+            size_divisor (int): Batches are padded to a multiple of it.
+                Default: 1.
         num_gpu (int): Number of GPUs. Used only in the train phase.
             Default: 1.
         dist (bool): Whether in distributed training. Used only in the train
@@ -75,7 +83,17 @@ def build_dataloader(dataset, dataset_opt, num_gpu=1, dist=False, sampler=None,
         dataloader_args['worker_init_fn'] = partial(
             worker_init_fn, num_workers=num_workers, rank=rank, seed=seed) if seed is not None else None
     elif phase in ['val', 'test']:  # validation
-        dataloader_args = dict(dataset=dataset, batch_size=1, shuffle=False, num_workers=0)
+        bucket_batch_size = dataset_opt.get('bucket_batch_size')
+        if bucket_batch_size:
+            batch_sampler = BucketBatchSampler(
+                _get_image_sizes(dataset), bucket_batch_size, bucket_step=dataset_opt.get('bucket_step', 8))
+            dataloader_args = dict(
+                dataset=dataset,
+                batch_sampler=batch_sampler,
+                num_workers=dataset_opt.get('num_worker_per_gpu', 0),
+                collate_fn=partial(bucket_collate_fn, size_divisor=dataset_opt.get('size_divisor', 1)))
+        else:
+            dataloader_args = dict(dataset=dataset, batch_size=1, shuffle=False, num_workers=0)
     else:
         raise ValueError(f'Wrong dataset phase: {phase}. ' "Supported ones are 'train', 'val' and 'test'.")
 
@@ -93,6 +111,26 @@ def build_dataloader(dataset, dataset_opt, num_gpu=1, dist=False, sampler=None,
         return torch.utils.data.DataLoader(**dataloader_args)
 
 
+def _get_image_sizes(dataset):
+    """Read the (h, w) of the input image of each sample, for
+    BucketBatchSampler. With ``dir_index``, the sizes are served from the
+    directory index of the data folder, so the headers are only read once."""
+    paths, key = [], 'gt'
+    for path in dataset.paths:
+        if isinstance(path, dict):
+            key = 'lq' if 'lq_path' in path else 'gt'
+            path = path[f'{key}_path']
+        paths.append(path)
+    index = None
+    if dataset.opt.get('dir_index', False) and dataset.opt.get(f'dataroot_{key}'):
+        index = DirectoryIndex(dataset.opt[f'dataroot_{key}'])
+    sizes = read_image_sizes(paths, index)
+    for path, size in zip(paths, sizes):
+        if size is None:
+            raise ValueError(f'Cannot read the image size of {path} for bucketing.')
+    return sizes
+
+
 def worker_init_fn(worker_id, num_workers, rank, seed):
     # Set the worker seed to num_workers * rank + worker_id + seed
     worker_seed = num_workers * rank + worker_id + seed
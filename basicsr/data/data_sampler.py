@@ -1,5 +1,7 @@
 import math
 import torch
+from torch.nn import functional as F
+from torch.utils.data.dataloader import default_collate
 from torch.utils.data.sampler import Sampler
 
 
@@ -46,3 +48,77 @@ class EnlargedSampler(Sampler):
 
     def set_epoch(self, epoch):
         self.epoch = epoch
+
+
+class BucketBatchSampler(Sampler):
+    """Batch sampler that groups images of the same padded size.
+
+    It is used for full-image validation and inference, where images differ
+    in size. Images are put into buckets by their size rounded up to
+    ``bucket_step``, and each batch is drawn from a single bucket, so that a
+    batch is padded by at most ``bucket_step - 1`` pixels per side instead of
+    being restricted to batch size 1. Use it with :func:`bucket_collate_fn`.
+
+    Args:
+        sizes (list[tuple[int]]): (h, w) of each sample in the dataset.
+        batch_size (int): Max number of samples in a batch.
+        bucket_step (int): Granularity of the buckets. 1 for only batching
+            images of identical size. Default: 8.
+        num_replicas (int): Number of processes. The batches are split
+            among them. Default: 1.
+        rank (int): Rank of the current process. Default: 0.
+    """
+
+    def __init__(self, sizes, batch_size, bucket_step=8, num_replicas=1, rank=0):
+        self.batch_size = batch_size
+        buckets = {}
+        for idx, (h, w) in enumerate(sizes):
+            key = (math.ceil(h / bucket_step) * bucket_step, math.ceil(w / bucket_step) * bucket_step)
+            buckets.setdefault(key, []).append(idx)
+        batches = []
+        for key in sorted(buckets.keys()):
+            indices = buckets[key]
+            batches.extend(indices[i:i + batch_size] for i in range(0, len(indices), batch_size))
+        self.batches = batches[rank::num_replicas]
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+
+def bucket_collate_fn(batch, size_divisor=1, size_key='lq'):
+    """Collate samples of different sizes by padding them to a common size.
+
+    Every 3D tensor (c, h, w) of a sample is padded at the bottom / right to
+    the largest size of its key in the batch, rounded up to ``size_divisor``.
+    The original size of ``size_key`` is returned as 'ori_size' (b, 2), so
+    that the outputs can be cropped back per sample.
+
+    Args:
+        batch (list[dict]): Samples from the dataset.
+        size_divisor (int): The padded size is a multiple of it, e.g., the
+            down factor of the network. Default: 1.
+        size_key (str): Key whose original size is recorded. Default: 'lq'.
+
+    Returns:
+        dict: Collated batch.
+    """
+    ori_size = torch.tensor([sample[size_key].shape[-2:] for sample in batch], dtype=torch.long)
+    padded = [dict(sample) for sample in batch]
+    for key, value in batch[0].items():
+        if not (torch.is_tensor(value) and value.dim() == 3):
+            continue
+        h = max(sample[key].size(1) for sample in batch)
+        w = max(sample[key].size(2) for sample in batch)
+        h, w = math.ceil(h / size_divisor) * size_divisor, math.ceil(w / size_divisor) * size_divisor
+        for sample in padded:
+            pad_h, pad_w = h - sample[key].size(1), w - sample[key].size(2)
+            if pad_h > 0 or pad_w > 0:
+                # reflect like check_image_size, unless the pad is too large
+                mode = 'reflect' if pad_h < sample[key].size(1) and pad_w < sample[key].size(2) else 'replicate'
+                sample[key] = F.pad(sample[key][None], (0, pad_w, 0, pad_h), mode=mode)[0]
+    batch = default_collate(padded)
+    batch['ori_size'] = ori_size
+    return batch
@@ -5,7 +5,7 @@ from os import path as osp
 from torch.nn import functional as F
 
 from basicsr.data.transforms import mod_crop
-from basicsr.utils import img2tensor, scandir
+from basicsr.utils import img2tensor, scandir, scandir_cached
 
 
 def read_img_seq(path, require_mod_crop=False, scale=1):
@@ -187,7 +187,15 @@ def paired_paths_from_meta_info_file(folders, keys, meta_info_file, filename_tmp
     return paths
 
 
-def paired_paths_from_folder(folders, keys, filename_tmpl):
+def _scan_folder(folder, use_index=False):
+    """Recursively list a folder with full paths, through the persistent
+    directory index if ``use_index`` is True."""
+    if use_index:
+        return scandir_cached(folder, recursive=True, full_path=True)
+    return list(scandir(folder, recursive=True, full_path=True))
+
+
+def paired_paths_from_folder(folders, keys, filename_tmpl, use_index=False):
     """Generate paired paths from folders.
 
     Args:
@@ -198,6 +206,8 @@ def paired_paths_from_folder(folders, keys, filename_tmpl):
         filename_tmpl (str): Template for each filename. Note that the
             template excludes the file extension. Usually the filename_tmpl is
             for files in the input folder.
+        use_index (bool): List the folders through the persistent directory
+            index (see :class:`basicsr.utils.DirectoryIndex`). Default: False.
 
     Returns:
         list[str]: Returned path list.
@@ -208,8 +218,8 @@ def paired_paths_from_folder(folders, keys, filename_tmpl):
     input_folder, gt_folder = folders
     input_key, gt_key = keys
 
-    input_paths = sorted(list(scandir(input_folder, recursive=True, full_path=True)))
-    gt_paths = sorted(list(scandir(gt_folder, recursive=True, full_path=True)))
+    input_paths = sorted(_scan_folder(input_folder, use_index))
+    gt_paths = sorted(_scan_folder(gt_folder, use_index))
     assert len(input_paths) == len(gt_paths), (f'{input_key} and {gt_key} datasets have different number of images: '
                                                f'{len(input_paths)}, {len(gt_paths)}.')
     paths = []
@@ -222,7 +232,7 @@ def paired_paths_from_folder(folders, keys, filename_tmpl):
     return paths
 
 
-def paired_paths_from_folder_prior(folders, keys, filename_tmpl):
+def paired_paths_from_folder_prior(folders, keys, filename_tmpl, use_index=False):
     """Generate paired paths from folders.
 
     Args:
@@ -233,6 +243,8 @@ def paired_paths_from_folder_prior(folders, keys, filename_tmpl):
         filename_tmpl (str): Template for each filename. Note that the
             template excludes the file extension. Usually the filename_tmpl is
             for files in the input folder.
+        use_index (bool): List the folders through the persistent directory
+            index (see :class:`basicsr.utils.DirectoryIndex`). Default: False.
 
     Returns:
         list[str]: Returned path list.
@@ -243,10 +255,10 @@ def paired_paths_from_folder_prior(folders, keys, filename_tmpl):
     input_folder, gt_folder, gt_fre_folder, gt_edge_folder = folders
     input_key, gt_key, gt_fre_key, gt_edge_key = keys
 
-    input_paths = sorted(list(scandir(input_folder, recursive=True, full_path=True)))
-    gt_paths = sorted(list(scandir(gt_folder, recursive=True, full_path=True)))
-    gt_fre_paths = sorted(list(scandir(gt_fre_folder, recursive=True, full_path=True)))
-    gt_edge_paths = sorted(list(scandir(gt_edge_folder, recursive=True, full_path=True)))
+    input_paths = sorted(_scan_folder(input_folder, use_index))
+    gt_paths = sorted(_scan_folder(gt_folder, use_index))
+    gt_fre_paths = sorted(_scan_folder(gt_fre_folder, use_index))
+    gt_edge_paths = sorted(_scan_folder(gt_edge_folder, use_index))
     assert len(input_paths) == len(gt_paths) == len(gt_fre_paths) == len(gt_fre_paths), \
         (f'{input_key} and {gt_key} and {gt_fre_key} and {gt_edge_key}datasets have different number of images:'
          f' 'f'{len(input_paths)}, {len(gt_paths)}, {len(gt_fre_paths)}, {len(gt_edge_paths)}.')
@@ -298,18 +310,24 @@ def paired_paths_from_folder_prior(folders, keys, filename_tmpl):
 #     return paths
 
 
-def paths_from_folder(folder, recursive=True, full_path=True):
+def paths_from_folder(folder, recursive=True, full_path=True, use_index=False):
     """Generate paths from folder.
 
     Args:
         folder (str): Folder path.
+        use_index (bool): List the folder through the persistent directory
+            index (see :class:`basicsr.utils.DirectoryIndex`). Default: False.
 
     Returns:
         list[str]: Returned path list.
     """
 
-    paths = list(scandir(folder, recursive=recursive, full_path=full_path))
-    paths = [osp.join(folder, path) for path in paths]
+    if use_index:
+        paths = scandir_cached(folder, recursive=recursive, full_path=full_path)
+    else:
+        paths = list(scandir(folder, recursive=recursive, full_path=full_path))
+    if not full_path:
+        paths = [osp.join(folder, path) for path in paths]
     return paths
 
 
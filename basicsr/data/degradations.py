@@ -3,6 +3,7 @@ import math
 import numpy as np
 import random
 import torch
+from torch.nn import functional as F
 from torchvision.transforms._functional_tensor import rgb_to_grayscale
 # from torchvision.transforms.functional_tensor import rgb_to_grayscale
 
@@ -221,6 +222,41 @@ def random_mixed_kernels(kernel_list,
     return kernel
 
 
+def filter2D(img, kernel):
+    """Convolve a batch of images with one blur kernel per sample (PyTorch
+    version).
+
+    All the samples are filtered by a single grouped convolution.
+
+    Args:
+        img (Tensor): Input image, shape (b, c, h, w).
+        kernel (ndarray | Tensor): Blur kernels, shape (k, k) shared by the
+            batch, or (b, k, k) for one kernel per sample. k is odd.
+    Returns:
+        (Tensor): Blurred image, shape (b, c, h, w).
+    """
+    if not torch.is_tensor(kernel):
+        kernel = torch.from_numpy(np.ascontiguousarray(kernel))
+    kernel = kernel.to(device=img.device, dtype=img.dtype)
+    k = kernel.size(-1)
+    b, c, h, w = img.size()
+    if k % 2 == 1:
+        img = F.pad(img, (k // 2, k // 2, k // 2, k // 2), mode='reflect')
+    else:
+        raise ValueError(f'Wrong kernel size {k}, it should be odd.')
+    ph, pw = img.size()[-2:]
+
+    if kernel.dim() == 2:
+        # share the same kernel across the batch and channels
+        img = img.reshape(b * c, 1, ph, pw)
+        kernel = kernel.view(1, 1, k, k)
+        return F.conv2d(img, kernel).view(b, c, h, w)
+    # one kernel per sample: fold the batch into the channel groups
+    img = img.reshape(1, b * c, ph, pw)
+    kernel = kernel.view(b, 1, 1, k, k).expand(b, c, 1, k, k).reshape(b * c, 1, k, k)
+    return F.conv2d(img, kernel, groups=b * c).view(b, c, h, w)
+
+
 # ------------------------------------------------------------- #
 # --------------------------- noise --------------------------- #
 # ------------------------------------------------------------- #
@@ -237,7 +273,6 @@ def generate_gaussian_noise(img, sigma=10, gray_noise=False):
         (Numpy array): Returned noisy image, shape (h, w, c), range[0, 1],
             float32.
     """
-    noise = np.float32(np.random.randn(*(img.shape))) * sigma / 255.
     if gray_noise:
         noise = np.float32(np.random.randn(*(img.shape[0:2]))) * sigma / 255.
         noise = np.expand_dims(noise, axis=2).repeat(3, axis=2)
@@ -288,6 +323,80 @@ def random_add_gaussian_noise(img, sigma_range=(0, 1.0), gray_prob=0, clip=True,
     return out
 
 
+def generate_gaussian_noise_pt(img, sigma=10, gray_noise=0):
+    """Generate a batch of Gaussian noise (PyTorch version)
+    Args:
+        img (Tensor): Input image, shape (b, c, h, w), range [0, 1], float32.
+        sigma (float | Tensor): Noise scale (measured in range 255). Number or
+            Tensor with shape (b). Default: 10.
+        gray_noise (float | Tensor): 0-1 number or Tensor with shape (b).
+            0 for False, 1 for True. Default: 0.
+    Returns:
+        (Tensor): Returned noisy image, shape (b, c, h, w), range[0, 1],
+            float32.
+    """
+    b, _, h, w = img.size()
+    if not isinstance(sigma, (float, int)):
+        sigma = sigma.view(b, 1, 1, 1)
+    if isinstance(gray_noise, (float, int)):
+        cal_gray_noise = gray_noise > 0
+    else:
+        gray_noise = gray_noise.view(b, 1, 1, 1)
+        cal_gray_noise = torch.sum(gray_noise) > 0
+
+    if cal_gray_noise:
+        noise_gray = torch.randn(b, 1, h, w, dtype=img.dtype, device=img.device) * sigma / 255.
+
+    # always calculate color noise
+    noise = torch.randn(*img.size(), dtype=img.dtype, device=img.device) * sigma / 255.
+    if cal_gray_noise:
+        noise = noise * (1 - gray_noise) + noise_gray * gray_noise
+    return noise
+
+
+def add_gaussian_noise_pt(img, sigma=10, gray_noise=0, clip=True, rounds=False):
+    """Add Gaussian noise to a batch of images (PyTorch version).
+    Args:
+        img (Tensor): Input image, shape (b, c, h, w), range [0, 1], float32.
+        sigma (float | Tensor): Noise scale (measured in range 255). Number or
+            Tensor with shape (b). Default: 10.
+        gray_noise (float | Tensor): 0-1 number or Tensor with shape (b).
+            0 for False, 1 for True. Default: 0.
+    Returns:
+        (Tensor): Returned noisy image, shape (b, c, h, w), range[0, 1],
+            float32.
+    """
+    noise = generate_gaussian_noise_pt(img, sigma, gray_noise)
+    out = img + noise
+    if clip and rounds:
+        out = torch.clamp((out * 255.0).round(), 0, 255) / 255.
+    elif clip:
+        out = torch.clamp(out, 0, 1)
+    elif rounds:
+        out = (out * 255.0).round() / 255.
+    return out
+
+
+def random_generate_gaussian_noise_pt(img, sigma_range=(0, 10), gray_prob=0):
+    sigma = torch.rand(
+        img.size(0), dtype=img.dtype, device=img.device) * (sigma_range[1] - sigma_range[0]) + sigma_range[0]
+    gray_noise = torch.rand(img.size(0), dtype=img.dtype, device=img.device)
+    gray_noise = (gray_noise < gray_prob).float()
+    return generate_gaussian_noise_pt(img, sigma, gray_noise)
+
+
+def random_add_gaussian_noise_pt(img, sigma_range=(0, 1.0), gray_prob=0, clip=True, rounds=False):
+    noise = random_generate_gaussian_noise_pt(img, sigma_range, gray_prob)
+    out = img + noise
+    if clip and rounds:
+        out = torch.clamp((out * 255.0).round(), 0, 255) / 255.
+    elif clip:
+        out = torch.clamp(out, 0, 1)
+    elif rounds:
+        out = (out * 255.0).round() / 255.
+    return out
+
+
 # ----------------------- Poisson (Shot) Noise ----------------------- #
 
 
@@ -336,6 +445,29 @@ def add_poisson_noise(img, scale=1.0, clip=True, rounds=False, gray_noise=False)
     return out
 
 
+def _count_vals_pt(img):
+    """Count the unique values of each sample in a batch of 8-bit images and
+    round the counts up to a power of 2.
+
+    The images are already rounded to 256 levels, so the unique values are
+    counted with a per-sample histogram instead of a for-loop over
+    ``torch.unique``.
+
+    Args:
+        img (Tensor): Rounded images with shape (b, c, h, w), range [0, 1].
+
+    Returns:
+        (Tensor): Counts with shape (b, 1, 1, 1).
+    """
+    b = img.size(0)
+    levels = (img * 255.0).round().long().view(b, -1)
+    hist = torch.zeros(b, 256, dtype=torch.uint8, device=img.device)
+    hist.scatter_(1, levels, 1)
+    vals = hist.sum(dim=1).to(img.dtype)
+    vals = 2**torch.ceil(torch.log2(vals))
+    return vals.view(b, 1, 1, 1)
+
+
 def generate_poisson_noise_pt(img, scale=1.0, gray_noise=0):
     """Generate a batch of poisson noise (PyTorch version)
     Args:
@@ -358,10 +490,7 @@ def generate_poisson_noise_pt(img, scale=1.0, gray_noise=0):
         img_gray = rgb_to_grayscale(img, num_output_channels=1)
         # round and clip image for counting vals correctly
         img_gray = torch.clamp((img_gray * 255.0).round(), 0, 255) / 255.
-        # use for-loop to get the unique values for each sample
-        vals_list = [len(torch.unique(img_gray[i, :, :, :])) for i in range(b)]
-        vals_list = [2**np.ceil(np.log2(vals)) for vals in vals_list]
-        vals = img_gray.new_tensor(vals_list).view(b, 1, 1, 1)
+        vals = _count_vals_pt(img_gray)
         out = torch.poisson(img_gray * vals) / vals
         noise_gray = out - img_gray
         noise_gray = noise_gray.expand(b, 3, h, w)
@@ -369,10 +498,7 @@ def generate_poisson_noise_pt(img, scale=1.0, gray_noise=0):
     # always calculate color noise
     # round and clip image for counting vals correctly
     img = torch.clamp((img * 255.0).round(), 0, 255) / 255.
-    # use for-loop to get the unique values for each sample
-    vals_list = [len(torch.unique(img[i, :, :, :])) for i in range(b)]
-    vals_list = [2**np.ceil(np.log2(vals)) for vals in vals_list]
-    vals = img.new_tensor(vals_list).view(b, 1, 1, 1)
+    vals = _count_vals_pt(img)
     out = torch.poisson(img * vals) / vals
     noise = out - img
     if cal_gray_noise:
@@ -482,4 +608,99 @@ def random_add_jpg_compression(img, quality_range=(90, 100)):
             float32.
     """
     quality = np.random.uniform(quality_range[0], quality_range[1])
-    return add_jpg_compression(img, quality)
\ No newline at end of file
+    return add_jpg_compression(img, quality)
+
+
+# JPEG quantization tables (quality 50), from Annex K of the JPEG standard
+_JPEG_Y_TABLE = [[16, 11, 10, 16, 24, 40, 51, 61], [12, 12, 14, 19, 26, 58, 60, 55], [14, 13, 16, 24, 40, 57, 69, 56],
+                 [14, 17, 22, 29, 51, 87, 80, 62], [18, 22, 37, 56, 68, 109, 103, 77],
+                 [24, 35, 55, 64, 81, 104, 113, 92], [49, 64, 78, 87, 103, 121, 120, 101],
+                 [72, 92, 95, 98, 112, 100, 103, 99]]
+_JPEG_C_TABLE = [[17, 18, 24, 47, 99, 99, 99, 99], [18, 21, 26, 66, 99, 99, 99, 99], [24, 26, 56, 99, 99, 99, 99, 99],
+                 [47, 66, 99, 99, 99, 99, 99, 99]] + [[99] * 8] * 4
+
+
+def _dct_matrix_8x8(dtype, device):
+    """Orthonormal 8-point DCT-II matrix."""
+    n = torch.arange(8, dtype=torch.float64)
+    mat = torch.cos((2 * n.view(1, 8) + 1) * n.view(8, 1) * math.pi / 16) * math.sqrt(2. / 8)
+    mat[0] = mat[0] / math.sqrt(2)
+    return mat.to(dtype=dtype, device=device)
+
+
+def add_jpg_compression_pt(img, quality=90):
+    """Add JPG-like compression artifacts to a batch of images (PyTorch
+    version).
+
+    It mimics the lossy part of JPEG on device: RGB to YCbCr, 8x8 block DCT,
+    quantization with the standard tables scaled by quality, and the inverse
+    transforms. Chroma subsampling and entropy coding are not applied, so it
+    is close to, but not bit-exact with, ``add_jpg_compression``.
+
+    Args:
+        img (Tensor): Input image, shape (b, 3, h, w), RGB, range [0, 1],
+            float32.
+        quality (float | Tensor): JPG compression quality. 0 for lowest
+            quality, 100 for best quality. Number or Tensor with shape (b).
+            Default: 90.
+    Returns:
+        (Tensor): Returned image after JPG, shape (b, 3, h, w), range[0, 1],
+            float32.
+    """
+    b, c, h, w = img.size()
+    dtype, device = img.dtype, img.device
+    # libjpeg quality scaling
+    if not torch.is_tensor(quality):
+        quality = torch.full((b, ), float(quality), dtype=dtype, device=device)
+    quality = quality.to(dtype=dtype, device=device).clamp(1, 100).view(b, 1, 1, 1, 1, 1)
+    factor = torch.where(quality < 50, 5000. / quality, 200. - quality * 2) / 100.
+    tables = torch.stack([
+        torch.tensor(_JPEG_Y_TABLE, dtype=dtype, device=device),
+        torch.tensor(_JPEG_C_TABLE, dtype=dtype, device=device),
+        torch.tensor(_JPEG_C_TABLE, dtype=dtype, device=device)
+    ]).view(1, 3, 1, 1, 8, 8)
+    tables = torch.clamp((tables * factor + 0.5).floor(), min=1)
+
+    img = torch.clamp(img, 0, 1) * 255.
+    r, g, bl = img[:, 0], img[:, 1], img[:, 2]
+    y = 0.299 * r + 0.587 * g + 0.114 * bl
+    cb = -0.168736 * r - 0.331264 * g + 0.5 * bl + 128.
+    cr = 0.5 * r - 0.418688 * g - 0.081312 * bl + 128.
+    ycc = torch.stack([y, cb, cr], dim=1) - 128.
+
+    # pad to multiples of 8 and split into 8x8 blocks: (b, c, nh, nw, 8, 8)
+    pad_h, pad_w = (8 - h % 8) % 8, (8 - w % 8) % 8
+    ycc = F.pad(ycc, (0, pad_w, 0, pad_h), mode='replicate')
+    nh, nw = (h + pad_h) // 8, (w + pad_w) // 8
+    blocks = ycc.view(b, c, nh, 8, nw, 8).permute(0, 1, 2, 4, 3, 5)
+
+    dct_mat = _dct_matrix_8x8(dtype, device)
+    coeffs = dct_mat @ blocks @ dct_mat.t()
+    coeffs = torch.round(coeffs / tables) * tables
+    blocks = dct_mat.t() @ coeffs @ dct_mat
+
+    ycc = blocks.permute(0, 1, 2, 4, 3, 5).reshape(b, c, nh * 8, nw * 8)[:, :, :h, :w] + 128.
+    y, cb, cr = ycc[:, 0], ycc[:, 1] - 128., ycc[:, 2] - 128.
+    r = y + 1.402 * cr
+    g = y - 0.344136 * cb - 0.714136 * cr
+    bl = y + 1.772 * cb
+    out = torch.stack([r, g, bl], dim=1)
+    return torch.clamp(out.round(), 0, 255) / 255.
+
+
+def random_add_jpg_compression_pt(img, quality_range=(90, 100)):
+    """Randomly add JPG-like compression artifacts to a batch of images
+    (PyTorch version).
+    Args:
+        img (Tensor): Input image, shape (b, 3, h, w), RGB, range [0, 1],
+            float32.
+        quality_range (tuple[float] | list[float]): JPG compression quality
+            range. 0 for lowest quality, 100 for best quality. Each sample
+            gets its own quality. Default: (90, 100).
+    Returns:
+        (Tensor): Returned image after JPG, shape (b, 3, h, w), range[0, 1],
+            float32.
+    """
+    quality = torch.rand(
+        img.size(0), dtype=img.dtype, device=img.device) * (quality_range[1] - quality_range[0]) + quality_range[0]
+    return add_jpg_compression_pt(img, quality)
@@ -0,0 +1,202 @@
+import itertools
+import math
+import numpy as np
+import os
+import os.path as osp
+import torch
+
+from basicsr.data.degradations import filter2D, mesh_grid
+from basicsr.utils import get_root_logger
+
+
+class BlurKernelBank(object):
+    """Precomputed bank of isotropic / anisotropic Gaussian blur kernels.
+
+    ``random_mixed_kernels`` builds every kernel from scratch (mesh grid,
+    sigma matrix, pdf and normalization) for each sample. The bank builds all
+    the kernels on a regular parameter grid once, stores them in a memmapped
+    ``.npy`` file, and samples kernels by index at run time, optionally with
+    multi-linear interpolation between the neighbouring grid kernels.
+
+    The kernels are stored as one array with shape (n, k, k): the first
+    ``num_sigma`` kernels are isotropic (indexed by sigma), and the rest are
+    anisotropic (indexed by sigma_x, sigma_y and rotation).
+
+    Args:
+        kernel_size (int): Kernel size, odd. Default: 21.
+        sigma_x_range (tuple): Range of sigma_x (and of the isotropic
+            sigma). Default: (0.6, 5).
+        sigma_y_range (tuple): Range of sigma_y. Default: (0.6, 5).
+        rotation_range (tuple): Range of rotation, in radian.
+            Default: (-math.pi, math.pi).
+        num_sigma (int): Number of grid points along each sigma axis.
+            Default: 32.
+        num_rotation (int): Number of grid points along the rotation axis.
+            Default: 16.
+        cache_dir (str | None): Folder for the memmapped bank. The file name
+            encodes the grid, so banks with different settings do not clash.
+            None for keeping the bank in memory. Default: None.
+    """
+
+    def __init__(self,
+                 kernel_size=21,
+                 sigma_x_range=(0.6, 5),
+                 sigma_y_range=(0.6, 5),
+                 rotation_range=(-math.pi, math.pi),
+                 num_sigma=32,
+                 num_rotation=16,
+                 cache_dir=None):
+        assert kernel_size % 2 == 1, 'Kernel size must be an odd number.'
+        assert sigma_x_range[0] < sigma_x_range[1], 'Wrong sigma_x_range.'
+        assert sigma_y_range[0] < sigma_y_range[1], 'Wrong sigma_y_range.'
+        assert rotation_range[0] < rotation_range[1], 'Wrong rotation_range.'
+        assert num_sigma > 1 and num_rotation > 1, 'The grid needs at least 2 points per axis.'
+        self.kernel_size = kernel_size
+        self.sigma_x_range = sigma_x_range
+        self.sigma_y_range = sigma_y_range
+        self.rotation_range = rotation_range
+        self.num_sigma = num_sigma
+        self.num_rotation = num_rotation
+        self.num_kernels = num_sigma + num_sigma * num_sigma * num_rotation
+
+        if cache_dir is None:
+            self.kernels = self._build_kernels()
+        else:
+            self.kernels = self._load_or_build(cache_dir)
+
+    def _cache_name(self):
+        return (f'kernel_bank_k{self.kernel_size}_sx{self.sigma_x_range[0]:g}-{self.sigma_x_range[1]:g}_'
+                f'sy{self.sigma_y_range[0]:g}-{self.sigma_y_range[1]:g}_'
+                f'r{self.rotation_range[0]:.4f}-{self.rotation_range[1]:.4f}_'
+                f'n{self.num_sigma}x{self.num_rotation}.npy')
+
+    def _load_or_build(self, cache_dir):
+        path = osp.join(cache_dir, self._cache_name())
+        if not osp.isfile(path):
+            logger = get_root_logger()
+            logger.info(f'Building blur kernel bank with {self.num_kernels} kernels: {path}')
+            os.makedirs(cache_dir, exist_ok=True)
+            # write to a temporary file first, so that concurrent workers
+            # never memmap a half-written bank
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            kernels = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=np.float32, shape=(self.num_kernels, self.kernel_size, self.kernel_size))
+            kernels[:] = self._build_kernels()
+            kernels.flush()
+            del kernels
+            os.replace(tmp_path, path)
+        kernels = np.load(path, mmap_mode='r')
+        if kernels.shape != (self.num_kernels, self.kernel_size, self.kernel_size):
+            raise ValueError(f'Kernel bank {path} has shape {kernels.shape}, which does not match its settings.')
+        return kernels
+
+    def _build_kernels(self):
+        """Build all the normalized kernels, vectorized over the grid."""
+        grid, _, _ = mesh_grid(self.kernel_size)
+        xx, yy = grid[None, :, :, 0], grid[None, :, :, 1]
+
+        # isotropic
+        sigma = np.linspace(self.sigma_x_range[0], self.sigma_x_range[1], self.num_sigma)[:, None, None]
+        iso = np.exp(-0.5 * (xx**2 + yy**2) / sigma**2)
+
+        # anisotropic: the inverse of U diag(sig_x^2, sig_y^2) U^T in closed form
+        sig_x, sig_y, theta = np.meshgrid(
+            np.linspace(self.sigma_x_range[0], self.sigma_x_range[1], self.num_sigma),
+            np.linspace(self.sigma_y_range[0], self.sigma_y_range[1], self.num_sigma),
+            np.linspace(self.rotation_range[0], self.rotation_range[1], self.num_rotation),
+            indexing='ij')
+        sig_x, sig_y, theta = (v.reshape(-1, 1, 1) for v in (sig_x, sig_y, theta))
+        cos, sin = np.cos(theta), np.sin(theta)
+        inv_x, inv_y = 1. / sig_x**2, 1. / sig_y**2
+        a = cos**2 * inv_x + sin**2 * inv_y
+        b = cos * sin * (inv_x - inv_y)
+        d = sin**2 * inv_x + cos**2 * inv_y
+        aniso = np.exp(-0.5 * (a * xx**2 + 2 * b * xx * yy + d * yy**2))
+
+        kernels = np.concatenate([iso, aniso], axis=0)
+        kernels = kernels / np.sum(kernels, axis=(1, 2), keepdims=True)
+        return kernels.astype(np.float32)
+
+    @staticmethod
+    def _axis_weights(value, value_range, num, interpolate):
+        """Map parameter values to grid indices and interpolation weights.
+
+        Returns:
+            list[tuple[ndarray]]: (index, weight) pairs along this axis.
+        """
+        pos = (value - value_range[0]) / (value_range[1] - value_range[0]) * (num - 1)
+        if not interpolate:
+            return [(np.clip(np.round(pos), 0, num - 1).astype(np.int64), np.ones_like(pos))]
+        low = np.clip(np.floor(pos), 0, num - 2).astype(np.int64)
+        frac = pos - low
+        return [(low, 1. - frac), (low + 1, frac)]
+
+    def sample(self,
+               num,
+               kernel_list=('iso', 'aniso'),
+               kernel_prob=(0.5, 0.5),
+               noise_range=None,
+               interpolate=False,
+               device=None):
+        """Randomly sample a batch of mixed kernels, in the same way as
+        ``random_mixed_kernels``.
+
+        Args:
+            num (int): Number of kernels.
+            kernel_list (tuple): Kernel types, support ['iso', 'aniso'].
+            kernel_prob (tuple): Corresponding probability for each kernel
+                type.
+            noise_range (tuple, optional): Multiplicative kernel noise,
+                [0.75, 1.25]. Default: None.
+            interpolate (bool): Interpolate between the neighbouring grid
+                kernels instead of taking the nearest one. Default: False.
+            device (torch.device | None): Device of the returned kernels.
+                Default: None.
+
+        Returns:
+            Tensor: Normalized kernels with shape (num, k, k), float32.
+        """
+        for kernel_type in kernel_list:
+            if kernel_type not in ('iso', 'aniso'):
+                raise NotImplementedError(f'Kernel type {kernel_type} is not supported by the kernel bank.')
+        kernel_prob = np.asarray(kernel_prob, dtype=np.float64)
+        types = np.random.choice(len(kernel_list), size=num, p=kernel_prob / kernel_prob.sum())
+        is_iso = np.array([kernel_list[t] == 'iso' for t in types], dtype=bool)
+
+        sig_x = np.random.uniform(self.sigma_x_range[0], self.sigma_x_range[1], size=num)
+        sig_y = np.random.uniform(self.sigma_y_range[0], self.sigma_y_range[1], size=num)
+        rotation = np.random.uniform(self.rotation_range[0], self.rotation_range[1], size=num)
+
+        kernels = np.zeros((num, self.kernel_size, self.kernel_size), dtype=np.float32)
+        x_axis = self._axis_weights(sig_x, self.sigma_x_range, self.num_sigma, interpolate)
+        y_axis = self._axis_weights(sig_y, self.sigma_y_range, self.num_sigma, interpolate)
+        r_axis = self._axis_weights(rotation, self.rotation_range, self.num_rotation, interpolate)
+        for (ix, wx), (iy, wy), (ir, wr) in itertools.product(x_axis, y_axis, r_axis):
+            aniso_idx = self.num_sigma + (ix * self.num_sigma + iy) * self.num_rotation + ir
+            # isotropic kernels only depend on sigma_x
+            index = np.where(is_iso, ix, aniso_idx)
+            weight = np.where(is_iso, wx / (len(y_axis) * len(r_axis)), wx * wy * wr)
+            kernels += self.kernels[index] * weight[:, None, None].astype(np.float32)
+
+        # add multiplicative noise
+        if noise_range is not None:
+            assert noise_range[0] < noise_range[1], 'Wrong noise range.'
+            kernels = kernels * np.random.uniform(noise_range[0], noise_range[1], size=kernels.shape)
+        kernels = kernels / np.sum(kernels, axis=(1, 2), keepdims=True)
+        kernels = torch.from_numpy(kernels.astype(np.float32))
+        if device is not None:
+            kernels = kernels.to(device)
+        return kernels
+
+    def blur(self, img, **kwargs):
+        """Blur a batch of images with one randomly sampled kernel per sample.
+
+        Args:
+            img (Tensor): Input image, shape (b, c, h, w).
+            kwargs: Arguments for :meth:`sample`.
+
+        Returns:
+            Tensor: Blurred image, shape (b, c, h, w).
+        """
+        kernels = self.sample(img.size(0), device=img.device, **kwargs)
+        return filter2D(img, kernels)
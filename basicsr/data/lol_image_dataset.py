@@ -8,7 +8,8 @@ from torchvision.transforms.functional import normalize
 from basicsr.data.data_util import paired_paths_from_folder, paths_from_folder
 from basicsr.data.transforms import augment, paired_random_crop
 from basicsr.archs.zerodce_arch import ConditionZeroDCE
-from basicsr.data.degradations import random_add_gaussian_noise, random_add_poisson_noise
+from basicsr.data.degradations import (random_add_gaussian_noise, random_add_gaussian_noise_pt,
+                                       random_add_poisson_noise, random_add_poisson_noise_pt)
 
 from basicsr.utils import FileClient, imfrombytes, img2tensor
 from basicsr.utils.download_util import load_file_from_url
@@ -48,6 +49,76 @@ class RandomLowLight(object):
 
         return low_light_img
 
+
+def rgb2lab_l(img):
+    """Compute the L channel of CIE Lab for a batch of sRGB images.
+
+    It follows the CIE definition (sRGB gamma expansion, D65 white point).
+    The L channel of ``cv2.cvtColor(img, cv2.COLOR_RGB2LAB)`` differs by up
+    to about 0.2, as OpenCV uses its own approximations.
+
+    Args:
+        img (Tensor): RGB images with shape (b, 3, h, w), range [0, 1].
+
+    Returns:
+        Tensor: L channel with shape (b, 1, h, w), range [0, 100].
+    """
+    img = img.clamp(0, 1)
+    img = torch.where(img > 0.04045, ((img + 0.055) / 1.055)**2.4, img / 12.92)
+    y = img[:, 0:1, :, :] * 0.212671 + img[:, 1:2, :, :] * 0.715160 + img[:, 2:3, :, :] * 0.072169
+    return torch.where(y > 0.008856, 116. * y.clamp(min=0.008856).pow(1. / 3) - 16., 903.3 * y)
+
+
+class BatchRandomLowLight(object):
+    """Batched, on-device version of :class:`RandomLowLight`.
+
+    Each sample in the batch gets its own exposure degree, and the whole
+    batch is darkened by a single ``ConditionZeroDCE`` forward pass.
+
+    Args:
+        low_light_net (nn.Module): Pretrained ``ConditionZeroDCE``.
+        exp_ranges (list[float]): Range of the random exposure degree.
+            Default: [0.05, 0.3].
+        max_batch (int | None): Max number of samples per forward pass, to
+            bound the memory of the 256-channel convs. None for the whole
+            batch. Default: None.
+    """
+
+    def __init__(self, low_light_net, exp_ranges=[0.05, 0.3], max_batch=None):
+        self.threshold = 0.97
+        self.exp_range = exp_ranges
+        self.low_light_net = low_light_net
+        self.max_batch = max_batch
+
+    @torch.no_grad()
+    def __call__(self, imgs, exp_degree=None):
+        """
+        Args:
+            imgs (Tensor): RGB images with shape (b, 3, h, w), range [0, 1].
+            exp_degree (Tensor | None): Exposure degree for each sample with
+                shape (b). If None, sample them from ``exp_ranges``.
+
+        Returns:
+            Tensor: Low-light images with shape (b, 3, h, w).
+        """
+        b = imgs.size(0)
+        if exp_degree is None:
+            exp_degree = torch.rand(b, device=imgs.device) * (self.exp_range[1] - self.exp_range[0]) + self.exp_range[0]
+        exp_degree = exp_degree.to(device=imgs.device, dtype=imgs.dtype).view(b, 1, 1, 1)
+
+        l_channel_f = rgb2lab_l(imgs) / 100.0
+        # keep saturated regions at their own brightness
+        exp_map = torch.where(l_channel_f > self.threshold, l_channel_f, exp_degree.expand_as(l_channel_f))
+
+        chunk = b if self.max_batch is None else self.max_batch
+        low_light_l = torch.cat([
+            self.low_light_net(l_channel_f[i:i + chunk], exp_map[i:i + chunk]) for i in range(0, b, chunk)
+        ], dim=0)
+
+        scale = low_light_l / (l_channel_f + 1e-10)
+        return imgs * scale
+
+
 class AddGaussianNoise(object):
     def __init__(self):
         self.noise_range = [0, 8]
@@ -59,6 +130,71 @@ class AddGaussianNoise(object):
             img = random_add_poisson_noise(img, scale_range=self.poisson_scale_range, gray_prob=0.3)
         return img
 
+    def apply_batch(self, imgs):
+        """Batched, on-device version of ``__call__``.
+
+        Args:
+            imgs (Tensor): Images with shape (b, c, h, w), range [0, 1].
+
+        Returns:
+            Tensor: Noisy images with shape (b, c, h, w).
+        """
+        use_gaussian = torch.rand(imgs.size(0), device=imgs.device) < 0.5
+        out = imgs.clone()
+        gaussian_idx = torch.nonzero(use_gaussian, as_tuple=False).squeeze(1)
+        poisson_idx = torch.nonzero(~use_gaussian, as_tuple=False).squeeze(1)
+        if gaussian_idx.numel() > 0:
+            out[gaussian_idx] = random_add_gaussian_noise_pt(
+                imgs[gaussian_idx], sigma_range=self.noise_range, gray_prob=0.3)
+        if poisson_idx.numel() > 0:
+            out[poisson_idx] = random_add_poisson_noise_pt(
+                imgs[poisson_idx], scale_range=self.poisson_scale_range, gray_prob=0.3)
+        return out
+
+
+class LOLBatchSynthesizer(object):
+    """Post-collate stage that synthesizes low-light batches on device.
+
+    It is used with ``LOLImageDataset`` when ``synthesize_on_device`` is True:
+    the dataset only crops and augments GT patches in the workers, and this
+    stage darkens, adds noise and normalizes the whole batch on the training
+    device. Build it with :meth:`LOLImageDataset.build_batch_synthesizer`.
+
+    Args:
+        low_light_net (nn.Module): Pretrained ``ConditionZeroDCE``. Batches
+            are synthesized on the device of its parameters.
+        exp_ranges (list[float]): Range of the random exposure degree.
+        add_noise (bool): Whether to add Gaussian / Poisson noise.
+        mean (list[float]): Mean for normalization.
+        std (list[float]): Std for normalization.
+        max_batch (int | None): See :class:`BatchRandomLowLight`.
+    """
+
+    def __init__(self, low_light_net, exp_ranges, add_noise, mean, std, max_batch=None):
+        self.device = next(low_light_net.parameters()).device
+        self.lol_generator = BatchRandomLowLight(low_light_net, exp_ranges=exp_ranges, max_batch=max_batch)
+        self.noise_adder = AddGaussianNoise() if add_noise else None
+        self.mean = mean
+        self.std = std
+
+    def __call__(self, batch):
+        """
+        Args:
+            batch (dict): Collated batch. It contains 'lq' (un-normalized GT
+                crops, RGB, [0, 1]) and 'exp_degree' (shape (b)).
+
+        Returns:
+            dict: The batch with normalized low-light 'lq'.
+        """
+        for k, v in batch.items():
+            if torch.is_tensor(v):
+                batch[k] = v.to(device=self.device, non_blocking=True)
+        img_lq = self.lol_generator(batch['lq'], batch.pop('exp_degree'))
+        if self.noise_adder is not None:
+            img_lq = self.noise_adder.apply_batch(img_lq)
+        batch['lq'] = normalize(img_lq, self.mean, self.std)
+        return batch
+
 
 @DATASET_REGISTRY.register()
 class LOLImageDataset(data.Dataset):
@@ -78,6 +214,14 @@ class LOLImageDataset(data.Dataset):
             use_flip (bool): Use horizontal flips.
             use_rot (bool): Use rotation (use vertical flip and transposing h
                 and w for implementation).
+            dir_index (bool): List the data folders through a persistent
+                directory index instead of walking them. Default: False.
+
+            synthesize_on_device (bool): Generate low-light images in a
+                batched post-collate stage on the training device instead of
+                per sample in the dataloader workers. Default: False.
+            exp_range (list[float]): Range of the random exposure degree.
+                Default: [0.05, 0.3].
 
             scale (bool): Scale, which will be added automatically.
             phase (str): 'train' or 'val'.
@@ -97,6 +241,8 @@ class LOLImageDataset(data.Dataset):
         self.use_rot = opt.get('use_rot', True)
         self.crop_size = opt.get('crop_size', 256)
         self.scale = opt.get('scale', 1)
+        self.synthesize_on_device = opt.get('synthesize_on_device', False)
+        self.exp_range = opt.get('exp_range', [0.05, 0.3])
 
         if 'filename_tmpl' in opt:
             self.filename_tmpl = opt['filename_tmpl']
@@ -105,17 +251,14 @@ class LOLImageDataset(data.Dataset):
 
         self.gt_folder, self.lq_folder = opt.get('dataroot_gt', None), opt.get('dataroot_lq', None)
         if self.generate_lol_img:
-            # load pretrained model
-            ckpt_path = load_file_from_url(
-                'https://github.com/sczhou/LEDNet/releases/download/v0.1.0/ce_zerodce.pth', 
-                model_dir='./weights', progress=True, file_name=None)
-            low_light_net = ConditionZeroDCE().cuda()
-            low_light_net.load_state_dict(torch.load(ckpt_path))
-            low_light_net.eval()
-            self.lol_generator = RandomLowLight(low_light_net, exp_ranges=[0.05, 0.3])
-            self.paths = paths_from_folder(self.gt_folder, recursive=True, full_path=True)
+            if not self.synthesize_on_device:
+                low_light_net = self._load_low_light_net(torch.device('cuda'))
+                self.lol_generator = RandomLowLight(low_light_net, exp_ranges=self.exp_range)
+            self.paths = paths_from_folder(
+                self.gt_folder, recursive=True, full_path=True, use_index=opt.get('dir_index', False))
         else:
-            self.paths = paired_paths_from_folder([self.lq_folder, self.gt_folder], ['lq', 'gt'], self.filename_tmpl)
+            self.paths = paired_paths_from_folder([self.lq_folder, self.gt_folder], ['lq', 'gt'], self.filename_tmpl,
+                                                  use_index=opt.get('dir_index', False))
         if self.add_gaussian_noise:
             self.noise_adder = AddGaussianNoise()
         if self.opt['phase'] == 'train':
@@ -141,6 +284,15 @@ class LOLImageDataset(data.Dataset):
 
         # augmentation for training
         if self.opt['phase'] == 'train':
+            if self.generate_lol_img and self.synthesize_on_device:
+                # low-light synthesis and noise are left to LOLBatchSynthesizer
+                img_gt, _ = paired_random_crop(img_gt, img_gt, self.crop_size, self.scale, gt_path)
+                img_gt = augment(img_gt, self.use_flip, self.use_rot)
+                img_gt, img_lq = img2tensor([img_gt, img_gt.copy()], bgr2rgb=True, float32=True)
+                normalize(img_gt, self.mean, self.std, inplace=True)
+                exp_degree = torch.tensor(random.uniform(*self.exp_range), dtype=torch.float32)
+                return {'lq': img_lq, 'gt': img_gt, 'exp_degree': exp_degree}
+
             # random crop
             if self.generate_lol_img:
                 img_gt, img_lq = paired_random_crop(img_gt, img_gt, self.crop_size, self.scale, gt_path)
@@ -165,3 +317,36 @@ class LOLImageDataset(data.Dataset):
 
     def __len__(self):
         return len(self.paths)
+
+    @staticmethod
+    def _load_low_light_net(device):
+        # load pretrained model
+        ckpt_path = load_file_from_url(
+            'https://github.com/sczhou/LEDNet/releases/download/v0.1.0/ce_zerodce.pth',
+            model_dir='./weights', progress=True, file_name=None)
+        low_light_net = ConditionZeroDCE().to(device)
+        low_light_net.load_state_dict(torch.load(ckpt_path, map_location=device))
+        low_light_net.eval()
+        return low_light_net
+
+    def build_batch_synthesizer(self, device, max_batch=None):
+        """Build the post-collate low-light stage for this dataset.
+
+        It must be called in the main process, and the returned callable is
+        applied to each collated batch after it is moved to ``device``. The
+        prefetchers build and apply it by default. Batches that skip it keep
+        'exp_degree', and are rejected by the model.
+
+        Args:
+            device (torch.device): The training device.
+            max_batch (int | None): See :class:`BatchRandomLowLight`.
+
+        Returns:
+            LOLBatchSynthesizer | None: None if the dataset does not
+                synthesize low-light images on device.
+        """
+        if not (self.generate_lol_img and self.synthesize_on_device and self.opt['phase'] == 'train'):
+            return None
+        low_light_net = self._load_low_light_net(device)
+        return LOLBatchSynthesizer(
+            low_light_net, self.exp_range, self.add_gaussian_noise, self.mean, self.std, max_batch=max_batch)
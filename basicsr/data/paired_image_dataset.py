@@ -39,6 +39,8 @@ class PairedImageDataset(data.Dataset):
             use_flip (bool): Use horizontal flips.
             use_rot (bool): Use rotation (use vertical flip and transposing h
                 and w for implementation).
+            dir_index (bool): List the data folders through a persistent
+                directory index instead of walking them. Default: False.
 
             scale (bool): Scale, which will be added automatically.
             phase (str): 'train' or 'val'.
@@ -68,7 +70,8 @@ class PairedImageDataset(data.Dataset):
                 self.filename_tmpl = '{}'
 
             self.paths = paired_paths_from_folder_prior([self.lq_folder, self.gt_folder, self.gt_fre_folder, self.gt_edge_folder],
-                                                  ['lq', 'gt', 'gt_fre', 'gt_edge'], self.filename_tmpl)
+                                                  ['lq', 'gt', 'gt_fre', 'gt_edge'], self.filename_tmpl,
+                                                  use_index=opt.get('dir_index', False))
             random.shuffle(self.paths)
         else:
             self.gt_folder, self.lq_folder = opt['dataroot_gt'], opt['dataroot_lq']
@@ -77,7 +80,8 @@ class PairedImageDataset(data.Dataset):
             else:
                 self.filename_tmpl = '{}'
 
-            self.paths = paired_paths_from_folder([self.lq_folder, self.gt_folder], ['lq', 'gt'], self.filename_tmpl)
+            self.paths = paired_paths_from_folder([self.lq_folder, self.gt_folder], ['lq', 'gt'], self.filename_tmpl,
+                                                  use_index=opt.get('dir_index', False))
 
     def __getitem__(self, index):
         if self.file_client is None:
@@ -62,7 +62,8 @@ class PairedImageDataset(data.Dataset):
         else:
             self.filename_tmpl = '{}'
 
-        self.paths = paired_paths_from_folder([self.lq_folder, self.gt_folder], ['lq', 'gt'], self.filename_tmpl)
+        self.paths = paired_paths_from_folder([self.lq_folder, self.gt_folder], ['lq', 'gt'], self.filename_tmpl,
+                                              use_index=opt.get('dir_index', False))
         if self.opt['phase'] == 'train':
             random.shuffle(self.paths)
 
@@ -60,22 +60,50 @@ class PrefetchDataLoader(DataLoader):
         return PrefetchGenerator(super().__iter__(), self.num_prefetch_queue)
 
 
+def build_batch_transform(loader, device):
+    """Build the post-collate stage of the dataset of a loader, if it has one.
+
+    Datasets that leave part of the pipeline to the training device (e.g.,
+    ``LOLImageDataset`` with ``synthesize_on_device``) expose it with
+    ``build_batch_synthesizer``.
+
+    Args:
+        loader: Dataloader.
+        device (torch.device): The training device.
+
+    Returns:
+        callable | None: The transform, or None if the dataset has none.
+    """
+    build = getattr(getattr(loader, 'dataset', None), 'build_batch_synthesizer', None)
+    return None if build is None else build(device)
+
+
 class CPUPrefetcher():
     """CPU prefetcher.
 
     Args:
         loader: Dataloader.
+        batch_transform (callable | None): Post-collate transform applied to
+            each batch. None for the one of the dataset, see
+            :func:`build_batch_transform`. Default: None.
     """
 
-    def __init__(self, loader):
+    def __init__(self, loader, batch_transform=None):
         self.ori_loader = loader
         self.loader = iter(loader)
+        if batch_transform is None:
+            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+            batch_transform = build_batch_transform(loader, device)
+        self.batch_transform = batch_transform
 
     def next(self):
         try:
-            return next(self.loader)
+            batch = next(self.loader)
         except StopIteration:
             return None
+        if self.batch_transform is not None:
+            batch = self.batch_transform(batch)
+        return batch
 
     def reset(self):
         self.loader = iter(self.ori_loader)
@@ -92,14 +120,20 @@ class CUDAPrefetcher():
     Args:
         loader: Dataloader.
         opt (dict): Options.
+        batch_transform (callable | None): Post-collate transform applied to
+            each batch on the device, in the prefetch stream. None for the one
+            of the dataset, see :func:`build_batch_transform`. Default: None.
     """
 
-    def __init__(self, loader, opt):
+    def __init__(self, loader, opt, batch_transform=None):
         self.ori_loader = loader
         self.loader = iter(loader)
         self.opt = opt
         self.stream = torch.cuda.Stream()
         self.device = torch.device('cuda' if opt['num_gpu'] != 0 else 'cpu')
+        if batch_transform is None:
+            batch_transform = build_batch_transform(loader, self.device)
+        self.batch_transform = batch_transform
         self.preload()
 
     def preload(self):
@@ -113,6 +147,8 @@ class CUDAPrefetcher():
             for k, v in self.batch.items():
                 if torch.is_tensor(v):
                     self.batch[k] = self.batch[k].to(device=self.device, non_blocking=True)
+            if self.batch_transform is not None:
+                self.batch = self.batch_transform(self.batch)
 
     def next(self):
         torch.cuda.current_stream().wait_stream(self.stream)
@@ -1,5 +1,5 @@
+import contextlib
 import math
-import lpips
 import torch
 from torch import autograd as autograd
 from torch import nn as nn
@@ -163,6 +163,20 @@ class PerceptualLoss(nn.Module):
             calculated and the loss will multiplied by the weight.
             Default: 0.
         criterion (str): Criterion used for perceptual loss. Default: 'l1'.
+        single_pass (bool): If True, extract the features of x and gt in one
+            batched vgg pass. It saves kernel launches and weight reads, but
+            the backward pass also goes through the gt half. Default: False.
+        channels_last (bool): If True, run vgg in channels_last memory format,
+            which is faster for convolutions with tensor cores.
+            Default: False.
+        use_amp (bool): If True, run vgg under its own autocast, and compute
+            the losses in float32. If False, vgg follows the enclosing
+            autocast, if any (e.g., the train ``use_amp`` option).
+            Default: False.
+        amp_dtype (str | None): Autocast dtype of ``use_amp``, 'float16' or
+            'bfloat16'. None for the dtype of the enclosing autocast, or
+            bfloat16 without one, which needs no loss scaling.
+            Default: None.
     """
 
     def __init__(self,
@@ -172,16 +186,28 @@ class PerceptualLoss(nn.Module):
                  range_norm=False,
                  perceptual_weight=1.0,
                  style_weight=0.,
-                 criterion='l1'):
+                 criterion='l1',
+                 single_pass=False,
+                 channels_last=False,
+                 use_amp=False,
+                 amp_dtype=None):
         super(PerceptualLoss, self).__init__()
         self.perceptual_weight = perceptual_weight
         self.style_weight = style_weight
         self.layer_weights = layer_weights
+        self.single_pass = single_pass
+        self.channels_last = channels_last
+        self.use_amp = use_amp
+        if amp_dtype not in (None, 'float16', 'bfloat16'):
+            raise ValueError(f'Wrong amp_dtype: {amp_dtype}. Supported ones are float16 and bfloat16.')
+        self.amp_dtype = None if amp_dtype is None else getattr(torch, amp_dtype)
         self.vgg = VGGFeatureExtractor(
             layer_name_list=list(layer_weights.keys()),
             vgg_type=vgg_type,
             use_input_norm=use_input_norm,
             range_norm=range_norm)
+        if self.channels_last:
+            self.vgg = self.vgg.to(memory_format=torch.channels_last)
 
         self.criterion_type = criterion
         if self.criterion_type == 'l1':
@@ -206,8 +232,7 @@ class PerceptualLoss(nn.Module):
             Tensor: Forward results.
         """
         # extract vgg features
-        x_features = self.vgg(x)
-        gt_features = self.vgg(gt.detach())
+        x_features, gt_features = self._extract_features(x, gt.detach())
 
         # calculate perceptual loss
         if self.perceptual_weight > 0:
@@ -237,6 +262,51 @@ class PerceptualLoss(nn.Module):
 
         return percep_loss, style_loss
 
+    def _extract_features(self, x, gt):
+        """Extract the vgg features of x and gt.
+
+        Args:
+            x (Tensor): Input tensor with shape (n, c, h, w).
+            gt (Tensor): Detached ground-truth tensor with shape (n, c, h, w).
+
+        Returns:
+            tuple[dict]: Features of x and gt.
+        """
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+            gt = gt.contiguous(memory_format=torch.channels_last)
+        if self.use_amp:
+            amp_dtype = self.amp_dtype or self._enclosing_autocast_dtype(x.device.type) or torch.bfloat16
+            amp_context = torch.autocast(device_type=x.device.type, dtype=amp_dtype)
+        else:
+            # keep the enclosing autocast, if any
+            amp_context = contextlib.nullcontext()
+        with amp_context:
+            if self.single_pass:
+                features = self.vgg(torch.cat([x, gt], dim=0))
+                x_features, gt_features = {}, {}
+                for k, v in features.items():
+                    x_features[k], gt_features[k] = v.chunk(2, dim=0)
+            else:
+                x_features = self.vgg(x)
+                gt_features = self.vgg(gt)
+        if self.use_amp:
+            x_features = {k: v.float() for k, v in x_features.items()}
+            gt_features = {k: v.float() for k, v in gt_features.items()}
+        return x_features, gt_features
+
+    @staticmethod
+    def _enclosing_autocast_dtype(device_type):
+        """Dtype of the enclosing autocast on a device type, or None."""
+        if hasattr(torch, 'get_autocast_dtype'):
+            if torch.is_autocast_enabled(device_type):
+                return torch.get_autocast_dtype(device_type)
+        elif device_type == 'cuda' and torch.is_autocast_enabled():
+            return torch.get_autocast_gpu_dtype()
+        elif device_type == 'cpu' and torch.is_autocast_cpu_enabled():
+            return torch.get_autocast_cpu_dtype()
+        return None
+
     def _gram_mat(self, x):
         """Calculate Gram matrix.
 
@@ -247,7 +317,8 @@ class PerceptualLoss(nn.Module):
             torch.Tensor: Gram matrix.
         """
         n, c, h, w = x.size()
-        features = x.view(n, c, w * h)
+        # reshape, as channels_last / chunked features may not be viewable
+        features = x.reshape(n, c, w * h)
         features_t = features.transpose(1, 2)
         gram = features.bmm(features_t) / (c * h * w)
         return gram
@@ -260,6 +331,7 @@ class LPIPSLoss(nn.Module):
             use_input_norm=True,
             range_norm=False,):
         super(LPIPSLoss, self).__init__()
+        import lpips  # slow to import, only needed by this loss
         self.perceptual = lpips.LPIPS(net="vgg", spatial=False).eval()
         self.loss_weight = loss_weight
         self.use_input_norm = use_input_norm
@@ -1,9 +1,13 @@
 from copy import deepcopy
 
 from basicsr.utils.registry import METRIC_REGISTRY
-from .psnr_ssim import calculate_psnr, calculate_ssim, calculate_lpips
+from .psnr_ssim import (LPIPSMetric, calculate_lpips, calculate_lpips_pt, calculate_psnr, calculate_psnr_pt,
+                        calculate_ssim, calculate_ssim_pt)
 
-__all__ = ['calculate_psnr', 'calculate_ssim', 'calculate_lpips']
+__all__ = [
+    'calculate_psnr', 'calculate_ssim', 'calculate_lpips', 'calculate_psnr_pt', 'calculate_ssim_pt', 'calculate_lpips_pt',
+    'LPIPSMetric'
+]
 
 
 def calculate_metric(data, opt):
@@ -1,4 +1,3 @@
-import importlib
 from copy import deepcopy
 from os import path as osp
 
@@ -12,8 +11,9 @@ __all__ = ['build_model']
 # '_model.py'
 model_folder = osp.dirname(osp.abspath(__file__))
 model_filenames = [osp.splitext(osp.basename(v))[0] for v in scandir(model_folder) if v.endswith('_model.py')]
-# import all the model modules
-_model_modules = [importlib.import_module(f'basicsr.models.{file_name}') for file_name in model_filenames]
+# register the model modules lazily, they are imported on first use
+for file_name in model_filenames:
+    MODEL_REGISTRY.register_lazy(f'basicsr.models.{file_name}', osp.join(model_folder, f'{file_name}.py'))
 
 
 def build_model(opt):
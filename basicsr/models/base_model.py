@@ -1,12 +1,14 @@
+import contextlib
 import logging
 import os
 import torch
 from collections import OrderedDict
-from copy import deepcopy
 from torch.nn.parallel import DataParallel, DistributedDataParallel
 
 from basicsr.models import lr_scheduler as lr_scheduler
+from basicsr.utils.checkpoint_writer import CheckpointWriter
 from basicsr.utils.dist_util import master_only
+from basicsr.utils.misc import load_checkpoint
 
 logger = logging.getLogger('basicsr')
 
@@ -49,13 +51,129 @@ class BaseModel():
             self.nondist_validation(dataloader, current_iter, tb_logger, save_img)
 
     def model_ema(self, decay=0.999):
-        net_g = self.get_bare_model(self.net_g)
+        """Update net_g_ema with the exponential moving average of net_g.
+
+        Parameters and floating-point buffers are averaged with fused
+        multi-tensor (foreach) ops over cached tensor lists, instead of one
+        mul_ / add_ per tensor; other buffers are copied. net_g_ema may live on
+        another device (e.g., CPU), in which case the weights are first copied
+        into persistent (pinned) buffers on that device, with one foreach copy
+        and one synchronize.
+
+        train:
+            ema_interval (int): Update the EMA every N calls, with decay**N
+                to make up for the skipped updates. Default: 1.
+
+        Args:
+            decay (float): Decay. 0 for copying the weights, which is always
+                applied regardless of ema_interval. Default: 0.999.
+        """
+        if decay > 0:
+            interval = self.opt['train'].get('ema_interval', 1)
+            self.ema_count = getattr(self, 'ema_count', 0) + 1
+            if self.ema_count % interval != 0:
+                return
+            decay = decay**interval
 
-        net_g_params = dict(net_g.named_parameters())
-        net_g_ema_params = dict(self.net_g_ema.named_parameters())
+        if getattr(self, '_ema_tensors', None) is None:
+            self._ema_tensors = self._get_ema_tensors()
+        ema_float, net_float, ema_other, net_other, copy_float = self._ema_tensors
 
-        for k in net_g_ema_params.keys():
-            net_g_ema_params[k].data.mul_(decay).add_(net_g_params[k].data, alpha=1 - decay)
+        with torch.no_grad():
+            if copy_float is not None:
+                torch._foreach_copy_(copy_float, net_float, non_blocking=True)
+                if net_float[0].is_cuda:
+                    # the foreach ops below read the copies on the host
+                    torch.cuda.current_stream(net_float[0].device).synchronize()
+                net_float = copy_float
+            if ema_float:
+                torch._foreach_mul_(ema_float, decay)
+                torch._foreach_add_(ema_float, net_float, alpha=1 - decay)
+            for ema_v, net_v in zip(ema_other, net_other):
+                ema_v.copy_(net_v)
+
+    def _get_ema_tensors(self):
+        """Pair the tensors of net_g_ema and net_g by name, for model_ema.
+
+        Returns:
+            tuple[list[Tensor]]: Floating-point tensors of net_g_ema and
+                net_g, the other buffers of net_g_ema and net_g, and the
+                buffers receiving the floating-point tensors of net_g on the
+                device of net_g_ema (None if they are on the same device).
+        """
+        net_g = self.get_bare_model(self.net_g)
+        net_g_tensors = dict(net_g.named_parameters())
+        net_g_tensors.update(net_g.named_buffers())
+        ema_tensors = dict(self.net_g_ema.named_parameters())
+        ema_tensors.update(self.net_g_ema.named_buffers())
+
+        ema_float, net_float, ema_other, net_other = [], [], [], []
+        for k, ema_v in ema_tensors.items():
+            if ema_v.is_floating_point():
+                ema_float.append(ema_v.data)
+                net_float.append(net_g_tensors[k].data)
+            else:
+                ema_other.append(ema_v.data)
+                net_other.append(net_g_tensors[k].data)
+
+        copy_float = None
+        if ema_float and ema_float[0].device != net_float[0].device:
+            # pinned, so that the device-to-host copies are asynchronous
+            copy_float = [
+                torch.empty(v.shape, dtype=v.dtype, device=ema_v.device, pin_memory=v.is_cuda)
+                for v, ema_v in zip(net_float, ema_float)
+            ]
+        return ema_float, net_float, ema_other, net_other, copy_float
+
+    def setup_amp(self):
+        """Set up automatic mixed precision (AMP) training from the options.
+
+        train:
+            use_amp (bool): Run the forward pass and losses under autocast.
+                Default: False.
+            amp_dtype (str): 'float16' (with dynamic loss scaling) or
+                'bfloat16' (no loss scaling needed). Default: 'float16'.
+        """
+        train_opt = self.opt['train']
+        self.use_amp = train_opt.get('use_amp', False)
+        amp_dtype = train_opt.get('amp_dtype', 'float16')
+        if amp_dtype not in ('float16', 'bfloat16'):
+            raise ValueError(f'Wrong amp_dtype: {amp_dtype}. Supported ones are float16 and bfloat16.')
+        self.amp_dtype = getattr(torch, amp_dtype)
+        # a disabled GradScaler is a pass-through, so the training step is the same with or without AMP
+        self.grad_scaler = torch.amp.GradScaler(self.device.type, enabled=self.use_amp and amp_dtype == 'float16')
+        if self.use_amp:
+            logger.info(f'Use automatic mixed precision training with {amp_dtype}.')
+
+    def setup_grad_accumulation(self):
+        """Set up gradient accumulation from the options.
+
+        train:
+            accumulate_grad_steps (int): Number of micro-batches (i.e.,
+                iterations) per optimizer step. The effective batch size is
+                multiplied by it. Schedulers step once per optimizer step, so
+                their milestones / periods count optimizer steps. Default: 1.
+        """
+        self.accumulate_grad_steps = self.opt['train'].get('accumulate_grad_steps', 1)
+        if self.accumulate_grad_steps < 1:
+            raise ValueError(f'accumulate_grad_steps should be >= 1, but got {self.accumulate_grad_steps}.')
+        self.micro_step = 0
+        # whether the last optimize_parameters call stepped the optimizers
+        self.optimizer_stepped = True
+        if self.accumulate_grad_steps > 1:
+            logger.info(f'Accumulate gradients over {self.accumulate_grad_steps} iterations.')
+
+    def grad_sync_context(self, net, sync):
+        """Context that skips the gradient all-reduce of DDP when ``sync`` is
+        False, for the intermediate micro-batches of gradient accumulation."""
+        if not sync and isinstance(net, DistributedDataParallel):
+            return net.no_sync()
+        return contextlib.nullcontext()
+
+    def autocast(self):
+        """Autocast context for the forward pass, a no-op if AMP is off."""
+        return torch.autocast(
+            device_type=self.device.type, dtype=self.amp_dtype, enabled=getattr(self, 'use_amp', False))
 
     def get_current_log(self):
         return self.log_dict
@@ -149,7 +267,8 @@ class BaseModel():
             warmup_iter (int)： Warmup iter numbers. -1 for no warmup.
                 Default： -1.
         """
-        if current_iter > 1:
+        # with gradient accumulation, only step after a real optimizer step
+        if current_iter > 1 and getattr(self, 'optimizer_stepped', True):
             for scheduler in self.schedulers:
                 scheduler.step()
         # set up warm-up learning rate
@@ -167,6 +286,26 @@ class BaseModel():
     def get_current_learning_rate(self):
         return [param_group['lr'] for param_group in self.optimizers[0].param_groups]
 
+    def get_checkpoint_writer(self):
+        """Get the checkpoint writer, built on first use.
+
+        logger:
+            async_checkpoint (bool): Snapshot the states into pinned host
+                memory and write them in a background thread. Default: False.
+            keep_last_checkpoints (int): Keep only the last N checkpoints of
+                each network and of the training states. 0 for keeping all.
+                Default: 0.
+
+        Returns:
+            CheckpointWriter: The checkpoint writer.
+        """
+        if getattr(self, 'checkpoint_writer', None) is None:
+            logger_opt = self.opt.get('logger', {})
+            self.checkpoint_writer = CheckpointWriter(
+                async_write=logger_opt.get('async_checkpoint', False),
+                keep_last=logger_opt.get('keep_last_checkpoints', 0))
+        return self.checkpoint_writer
+
     @master_only
     def save_network(self, net, net_label, current_iter, param_key='params'):
         """Save networks.
@@ -178,6 +317,8 @@ class BaseModel():
             param_key (str | list[str]): The parameter key(s) to save network.
                 Default: 'params'.
         """
+        # 'latest' checkpoints are never removed by keep_last_checkpoints
+        group = None if current_iter == -1 else net_label
         if current_iter == -1:
             current_iter = 'latest'
         save_filename = f'{net_label}_{current_iter}.pth'
@@ -187,6 +328,7 @@ class BaseModel():
         param_key = param_key if isinstance(param_key, list) else [param_key]
         assert len(net) == len(param_key), 'The lengths of net and param_key should be the same.'
 
+        writer = self.get_checkpoint_writer()
         save_dict = {}
         for net_, param_key_ in zip(net, param_key):
             net_ = self.get_bare_model(net_)
@@ -194,10 +336,11 @@ class BaseModel():
             for key, param in state_dict.items():
                 if key.startswith('module.'):  # remove unnecessary 'module.'
                     key = key[7:]
-                state_dict[key] = param.cpu()
+                # the asynchronous writer copies to pinned host memory itself
+                state_dict[key] = param if writer.async_write else param.cpu()
             save_dict[param_key_] = state_dict
 
-        torch.save(save_dict, save_path)
+        writer.save(save_dict, save_path, group=group)
 
     def _print_different_keys_loading(self, crt_net, load_net, strict=True):
         """Print keys with differnet name or different size when loading models.
@@ -246,17 +389,8 @@ class BaseModel():
         """
         net = self.get_bare_model(net)
         logger.info(f'Loading {net.__class__.__name__} model from {load_path}.')
-        load_net = torch.load(load_path, map_location=lambda storage, loc: storage)
-        if param_key is not None:
-            if param_key not in load_net and 'params' in load_net:
-                param_key = 'params'
-                logger.info('Loading: params_ema does not exist, use params.')
-            load_net = load_net[param_key]
-        # remove unnecessary 'module.'
-        for k, v in deepcopy(load_net).items():
-            if k.startswith('module.'):
-                load_net[k[7:]] = v
-                load_net.pop(k)
+        # memory-mapped, and 'module.' is stripped without copying the state dict
+        load_net = load_checkpoint(load_path, param_key=param_key)
         self._print_different_keys_loading(net, load_net, strict)
         net.load_state_dict(load_net, strict=strict)
 
@@ -275,9 +409,11 @@ class BaseModel():
                 state['optimizers'].append(o.state_dict())
             for s in self.schedulers:
                 state['schedulers'].append(s.state_dict())
+            if getattr(self, 'grad_scaler', None) is not None:
+                state['grad_scaler'] = self.grad_scaler.state_dict()
             save_filename = f'{current_iter}.state'
             save_path = os.path.join(self.opt['path']['training_states'], save_filename)
-            torch.save(state, save_path)
+            self.get_checkpoint_writer().save(state, save_path, group='training_state')
 
     def resume_training(self, resume_state):
         """Reload the optimizers and schedulers for resumed training.
@@ -293,6 +429,8 @@ class BaseModel():
             self.optimizers[i].load_state_dict(o)
         for i, s in enumerate(resume_schedulers):
             self.schedulers[i].load_state_dict(s)
+        if 'grad_scaler' in resume_state and getattr(self, 'grad_scaler', None) is not None:
+            self.grad_scaler.load_state_dict(resume_state['grad_scaler'])
 
     def reduce_loss_dict(self, loss_dict):
         """reduce loss dict.
@@ -12,7 +12,7 @@ import os
 from basicsr.archs import build_network
 from basicsr.losses import build_loss
 from basicsr.metrics import calculate_metric
-from basicsr.utils import get_root_logger, imwrite, tensor2img
+from basicsr.utils import AsyncImageWriter, get_root_logger
 from basicsr.utils.registry import MODEL_REGISTRY
 from .base_model import BaseModel
 
@@ -68,7 +68,9 @@ class LEDNetModel(BaseModel):
             # define network net_g with Exponential Moving Average (EMA)
             # net_g_ema is used only for testing on one GPU and saving
             # There is no need to wrap with DistributedDataParallel
-            self.net_g_ema = build_network(self.opt['network_g']).to(self.device)
+            # ema_on_cpu keeps it on CPU to save GPU memory
+            ema_device = torch.device('cpu') if train_opt.get('ema_on_cpu', False) else self.device
+            self.net_g_ema = build_network(self.opt['network_g']).to(ema_device)
             # load pretrained model
             load_path = self.opt['path'].get('pretrain_network_g', None)
             if load_path is not None:
@@ -98,6 +100,8 @@ class LEDNetModel(BaseModel):
         # set up optimizers and schedulers
         self.setup_optimizers()
         self.setup_schedulers()
+        self.setup_amp()
+        self.setup_grad_accumulation()
 
     def setup_optimizers(self):
         train_opt = self.opt['train']
@@ -114,6 +118,11 @@ class LEDNetModel(BaseModel):
         self.optimizers.append(self.optimizer_g)
 
     def feed_data(self, data):
+        if 'exp_degree' in data:
+            # LOLBatchSynthesizer consumes it, so 'lq' is still the GT here
+            raise ValueError('The batch has not been through the low-light synthesis of synthesize_on_device. '
+                             'Load it with CPUPrefetcher / CUDAPrefetcher, or apply '
+                             'LOLImageDataset.build_batch_synthesizer to it.')
         self.lq = data['lq'].to(self.device)  # low-blurred image
         self.gt = data['gt'].to(self.device)  # ground truth
 
@@ -121,9 +130,8 @@ class LEDNetModel(BaseModel):
         self.gt_edge = data['edge'].to(self.device)  # ground truth
         self.gt_fre = data['gt_fre'].to(self.device)  # ground truth
 
-    def optimize_parameters(self, current_iter):
-        self.optimizer_g.zero_grad()
-
+    def get_snr_mask(self):
+        """Compute the normalized SNR map of self.lq, in range [0, 1]."""
         # SNR-mask calculate
         dark = self.lq
         dark = dark[:, 0:1, :, :] * 0.299 + dark[:, 1:2, :, :] * 0.587 + dark[:, 2:3, :, :] * 0.114  # gray-scale
@@ -136,104 +144,105 @@ class LEDNetModel(BaseModel):
         batch_size = mask.shape[0]
         height = mask.shape[2]
         width = mask.shape[3]
-        x = mask.view(batch_size, -1)
-        y = torch.max(x, dim=1)
         mask_max = torch.max(mask.view(batch_size, -1), dim=1)[0]
         mask_max = mask_max.view(batch_size, 1, 1, 1)
         mask_max = mask_max.repeat(1, 1, height, width)
         mask = mask * 1.0 / (mask_max + 0.0001)  # normalize its values to range [0, 1]
 
         mask = torch.clamp(mask, min=0, max=1.0)
-        mask = mask.float()
-
-        # prediction output
-        # self.edge_output, self.fre_output, self.output, self.side_output = self.net_g(self.lq, mask, side_loss=self.use_side_loss)
-        self.edge_output, self.fre_output, self.output = self.net_g(self.lq, mask, side_loss=self.use_side_loss)
-        # edge and frequency down-sample
-        if self.down_edge_fre_loss:
-            h, w = self.edge_output.shape[2:]
-            self.gt_edge = torch.nn.functional.interpolate(self.gt_edge, (h, w), mode='bicubic', align_corners=False)
-            self.gt_fre = torch.nn.functional.interpolate(self.gt_fre, (h, w), mode='bicubic', align_corners=False)
-
-        # Intermediate gt
-        if self.use_side_loss:
-            h, w = self.side_output.shape[2:]
-            self.side_gt = torch.nn.functional.interpolate(self.gt, (h, w), mode='bicubic', align_corners=False)
-
-        l_total = 0
-        loss_dict = OrderedDict()
-        # pixel loss
-        if self.cri_pix:
-            l_pix = self.cri_pix(self.output, self.gt)
-            l_total += l_pix
-            loss_dict['l_pix'] = l_pix
-            if self.use_side_loss:
-                l_side_pix = self.cri_pix(self.side_output, self.side_gt) * self.side_loss_weight
-                l_total += l_side_pix
-                loss_dict['l_side_pix'] = l_side_pix
-
-        # perceptual loss
-        if self.cri_perceptual:
-            l_percep, _ = self.cri_perceptual(self.output, self.gt)
-            l_total += l_percep
-            loss_dict['l_percep'] = l_percep
-            if self.use_side_loss:
-                l_side_percep, _ = self.cri_perceptual(self.side_output, self.side_gt)
-                l_side_percep = l_side_percep * self.side_loss_weight
-                l_total += l_side_percep
-                loss_dict['l_side_percep'] = l_side_percep
-
-        # edge and high_frequency loss
-        if self.cri_pix:
-            l_edge = self.cri_pix(self.edge_output, self.gt_edge) * 0.001
-            l_total += l_edge
-            loss_dict['l_edge'] = l_edge
-
-            l_fre = self.cri_pix(self.fre_output, self.gt_fre) * 0.001
-            l_total += l_fre
-            loss_dict['l_fre'] = l_fre
-
-        loss_dict['l_total'] = l_total
-        l_total.backward()
-        self.optimizer_g.step()
+        return mask.float()
+
+    def optimize_parameters(self, current_iter):
+        # gradient accumulation: zero grads at the first micro-batch, step at the last one
+        is_first_micro_step = self.micro_step == 0
+        self.micro_step = (self.micro_step + 1) % self.accumulate_grad_steps
+        is_last_micro_step = self.micro_step == 0
+        if is_first_micro_step:
+            self.optimizer_g.zero_grad()
+
+        mask = self.get_snr_mask()
+
+        # no DDP all-reduce for the intermediate micro-batches
+        with self.grad_sync_context(self.net_g, sync=is_last_micro_step):
+            # forward and losses run under autocast when use_amp is set
+            with self.autocast():
+                # prediction output
+                # self.edge_output, self.fre_output, self.output, self.side_output = self.net_g(self.lq, mask, side_loss=self.use_side_loss)
+                self.edge_output, self.fre_output, self.output = self.net_g(self.lq, mask, side_loss=self.use_side_loss)
+                # edge and frequency down-sample
+                if self.down_edge_fre_loss:
+                    h, w = self.edge_output.shape[2:]
+                    self.gt_edge = torch.nn.functional.interpolate(
+                        self.gt_edge, (h, w), mode='bicubic', align_corners=False)
+                    self.gt_fre = torch.nn.functional.interpolate(
+                        self.gt_fre, (h, w), mode='bicubic', align_corners=False)
+
+                # Intermediate gt
+                if self.use_side_loss:
+                    h, w = self.side_output.shape[2:]
+                    self.side_gt = torch.nn.functional.interpolate(
+                        self.gt, (h, w), mode='bicubic', align_corners=False)
+
+                l_total = 0
+                loss_dict = OrderedDict()
+                # pixel loss
+                if self.cri_pix:
+                    l_pix = self.cri_pix(self.output, self.gt)
+                    l_total += l_pix
+                    loss_dict['l_pix'] = l_pix
+                    if self.use_side_loss:
+                        l_side_pix = self.cri_pix(self.side_output, self.side_gt) * self.side_loss_weight
+                        l_total += l_side_pix
+                        loss_dict['l_side_pix'] = l_side_pix
+
+                # perceptual loss
+                if self.cri_perceptual:
+                    l_percep, _ = self.cri_perceptual(self.output, self.gt)
+                    l_total += l_percep
+                    loss_dict['l_percep'] = l_percep
+                    if self.use_side_loss:
+                        l_side_percep, _ = self.cri_perceptual(self.side_output, self.side_gt)
+                        l_side_percep = l_side_percep * self.side_loss_weight
+                        l_total += l_side_percep
+                        loss_dict['l_side_percep'] = l_side_percep
+
+                # edge and high_frequency loss
+                if self.cri_pix:
+                    l_edge = self.cri_pix(self.edge_output, self.gt_edge) * 0.001
+                    l_total += l_edge
+                    loss_dict['l_edge'] = l_edge
+
+                    l_fre = self.cri_pix(self.fre_output, self.gt_fre) * 0.001
+                    l_total += l_fre
+                    loss_dict['l_fre'] = l_fre
+
+            loss_dict['l_total'] = l_total
+            self.grad_scaler.scale(l_total / self.accumulate_grad_steps).backward()
+
+        self.optimizer_stepped = is_last_micro_step
+        if is_last_micro_step:
+            self.grad_scaler.step(self.optimizer_g)
+            self.grad_scaler.update()
 
         self.log_dict = self.reduce_loss_dict(loss_dict)
 
-        if self.ema_decay > 0:
+        if self.ema_decay > 0 and is_last_micro_step:
             self.model_ema(decay=self.ema_decay)
 
     def test(self):
+        mask = self.get_snr_mask()
+
         if self.ema_decay > 0:
             self.net_g_ema.eval()
+            # net_g_ema may be kept on CPU (ema_on_cpu)
+            ema_device = next(self.net_g_ema.parameters()).device
             with torch.no_grad():
-                self.output = self.net_g_ema(self.lq)
+                self.edge_output, self.fre_output, self.output = self.net_g_ema(
+                    self.lq.to(ema_device), mask.to(ema_device))
+            self.output = self.output.to(self.device)
         else:
             self.net_g.eval()
             with torch.no_grad():
-
-                # SNR-mask calculate
-                dark = self.lq
-                dark = dark[:, 0:1, :, :] * 0.299 + dark[:, 1:2, :, :] * 0.587 + dark[:, 2:3, :,
-                                                                                 :] * 0.114  # gray-scale
-                light = self.nf
-                light = light[:, 0:1, :, :] * 0.299 + light[:, 1:2, :, :] * 0.587 + light[:, 2:3, :, :] * 0.114
-                noise = torch.abs(dark - light)  # noise map
-
-                mask = torch.div(light, noise + 0.0001)  # SNR map = clear map / noise map
-
-                batch_size = mask.shape[0]
-                height = mask.shape[2]
-                width = mask.shape[3]
-                x = mask.view(batch_size, -1)
-                y = torch.max(x, dim=1)
-                mask_max = torch.max(mask.view(batch_size, -1), dim=1)[0]
-                mask_max = mask_max.view(batch_size, 1, 1, 1)
-                mask_max = mask_max.repeat(1, 1, height, width)
-                mask = mask * 1.0 / (mask_max + 0.0001)  # normalize its values to range [0, 1]
-
-                mask = torch.clamp(mask, min=0, max=1.0)
-                mask = mask.float()
-
                 self.edge_output, self.fre_output, self.output = self.net_g(self.lq, mask)
             self.net_g.train()
 
@@ -245,97 +254,109 @@ class LEDNetModel(BaseModel):
         dataset_name = dataloader.dataset.opt['name']
         with_metrics = self.opt['val'].get('metrics') is not None
         if with_metrics:
+            # running sums; metrics computed on device (type ending with '_pt')
+            # stay on device, so there is no synchronization per image
             self.metric_results = {metric: 0 for metric in self.opt['val']['metrics'].keys()}
-        pbar = tqdm(total=len(dataloader), unit='image')
-
-        for idx, val_data in enumerate(dataloader):
-            img_name = osp.splitext(osp.basename(val_data['lq_path'][0]))[0]  # image name
-
-            # extract sub_folder name
-            folder2 = os.path.splitext(val_data['lq_path'][0])[0]  # sub_folder name
-            folder1 = os.path.split(folder2)[0]
-            folder = os.path.split(folder1)[1]
+            device_metrics = {
+                name for name, opt_ in self.opt['val']['metrics'].items() if opt_['type'].endswith('_pt')
+            }
+            need_numpy = len(device_metrics) < len(self.metric_results)
+        else:
+            need_numpy = False
+        writer = AsyncImageWriter(self.opt['val'].get('num_writer', 1)) if save_img and self.opt['is_train'] else None
+        pbar = tqdm(total=len(dataloader.dataset), unit='image')
+        num_img = 0
 
+        for val_data in dataloader:
             self.feed_data(val_data)
             self.test()
 
-            visuals = self.get_current_visuals()
-
-            # no normalize
-            sr_img = tensor2img([visuals['result']])
-            # normalize
-            # sr_img = tensor2img([visuals['result']], rgb2bgr=True, min_max=(-1, 1))
-            if 'gt' in visuals:
-                # no normalize
-                gt_img = tensor2img([visuals['gt']])
-                # normalize
-                # gt_img = tensor2img([visuals['gt']], rgb2bgr=True, min_max=(-1, 1))
+            result = self.output.detach()
+            gt = self.gt if hasattr(self, 'gt') else None
+            if gt is not None:
                 del self.gt
-
-            # visual edge and high_frequency
-            # sr_gt_edge = tensor2img([visuals['gt_edge']])
-            # sr_gt_fre = tensor2img([visuals['gt_fre']])
-            # sr_edge_output = tensor2img([visuals['edge_output']])
-            # sr_fre_output = tensor2img([visuals['fre_output']])
-
-            # tentative for out of GPU memory
             del self.lq
             del self.output
-            torch.cuda.empty_cache()
-
-            if save_img:
-                if self.opt['is_train']:
-                    # save prediction
-                    save_img_name = osp.join(self.opt['path']['visualization'], '%01d' % current_iter, f'{folder}',
-                                             f'{img_name}.png')
-                    imwrite(sr_img, save_img_name)
-
-                    # # save  edge and high_frequency
-                    # save_img_gt_edge = osp.join(self.opt['path']['visualization_gt_edge'], '%01d' % current_iter, f'{folder}',f'{img_name}.png')
-                    # imwrite(sr_gt_edge, save_img_gt_edge)
-                    #
-                    # save_img_gt_fre = osp.join(self.opt['path']['visualization_gt_fre'], '%01d' % current_iter, f'{folder}', f'{img_name}.png')
-                    # imwrite(sr_gt_fre, save_img_gt_fre)
-                    #
-                    # save_img_edge_output = osp.join(self.opt['path']['visualization_edge_output'], '%01d' % current_iter, f'{folder}', f'{img_name}.png')
-                    # imwrite(sr_edge_output, save_img_edge_output)
-                    #
-                    # save_img_fre_output = osp.join(self.opt['path']['visualization_fre_output'], '%01d' % current_iter, f'{folder}', f'{img_name}.png')
-                    # imwrite(sr_fre_output, save_img_fre_output)
-
-                    # save_img_path = osp.join(self.opt['path']['visualization'], '%01d' % current_iter, f'{folder}')
-                    # os.makedirs(save_img_path, exist_ok=True)
-                    # save_img_name = osp.join(self.opt['path']['visualization'], '%01d' % current_iter, f'{folder}', f'{img_name}.png')
-                    # cv2.imwrite(save_img_name, sr_img.astype(np.uint8))
-
-            # if save_img:
-            #     if self.opt['is_train']:
-            #         save_img_path = osp.join(self.opt['path']['visualization'], img_name,
-            #                                  f'{img_name}_{current_iter}.png')
-            #     else:
-            #         if self.opt['val']['suffix']:
-            #             save_img_path = osp.join(self.opt['path']['visualization'], dataset_name,
-            #                                      f'{img_name}_{self.opt["val"]["suffix"]}.png')
-            #         else:
-            #             save_img_path = osp.join(self.opt['path']['visualization'], dataset_name,
-            #                                      f'{img_name}_{self.opt["name"]}.png')
-            #     imwrite(sr_img, save_img_path)
-
-            if with_metrics:
-                # calculate metrics
-                for name, opt_ in self.opt['val']['metrics'].items():
-                    metric_data = dict(img1=sr_img, img2=gt_img)
-                    self.metric_results[name] += calculate_metric(metric_data, opt_)
-            pbar.update(1)
-            pbar.set_description(f'Test {img_name}')
+
+            # batches from BucketBatchSampler are padded, crop each group of
+            # samples with the same original size back at once
+            ori_size = val_data.get('ori_size')
+            if ori_size is None:
+                size_groups = {tuple(result.shape[2:]): list(range(result.size(0)))}
+            else:
+                size_groups = {}
+                for i, size in enumerate(ori_size.tolist()):
+                    size_groups.setdefault(tuple(size), []).append(i)
+
+            for (h, w), indices in size_groups.items():
+                # quantize in the same way as tensor2img, so that the metrics
+                # match the ones computed on uint8 images
+                sr_batch = self._quantize(result[indices, :, :h, :w])
+                gt_batch = None if gt is None else self._quantize(gt[indices, :, :h, :w])
+
+                if with_metrics:
+                    for name in device_metrics:
+                        metric_data = dict(img1=sr_batch, img2=gt_batch)
+                        self.metric_results[name] += calculate_metric(metric_data,
+                                                                      self.opt['val']['metrics'][name]).sum()
+
+                if not (writer is not None or need_numpy):
+                    num_img += len(indices)
+                    pbar.update(len(indices))
+                    continue
+
+                sr_imgs = self._to_numpy_images(sr_batch)
+                gt_imgs = self._to_numpy_images(gt_batch) if need_numpy else None
+                for j, i in enumerate(indices):
+                    lq_path = val_data['lq_path'][i]
+                    img_name = osp.splitext(osp.basename(lq_path))[0]  # image name
+
+                    # extract sub_folder name
+                    folder2 = os.path.splitext(lq_path)[0]  # sub_folder name
+                    folder1 = os.path.split(folder2)[0]
+                    folder = os.path.split(folder1)[1]
+
+                    if writer is not None:
+                        # save prediction
+                        save_img_name = osp.join(self.opt['path']['visualization'], '%01d' % current_iter,
+                                                 f'{folder}', f'{img_name}.png')
+                        writer.write(sr_imgs[j], save_img_name)
+
+                    if need_numpy:
+                        # calculate metrics
+                        for name, opt_ in self.opt['val']['metrics'].items():
+                            if name not in device_metrics:
+                                metric_data = dict(img1=sr_imgs[j], img2=gt_imgs[j])
+                                self.metric_results[name] += calculate_metric(metric_data, opt_)
+                    num_img += 1
+                    pbar.update(1)
+                    pbar.set_description(f'Test {img_name}')
         pbar.close()
+        if writer is not None:
+            writer.close()
+        # tentative for out of GPU memory
+        torch.cuda.empty_cache()
 
         if with_metrics:
             for metric in self.metric_results.keys():
-                self.metric_results[metric] /= (idx + 1)
+                value = self.metric_results[metric] / num_img
+                self.metric_results[metric] = value.item() if torch.is_tensor(value) else float(value)
 
             self._log_validation_metric_values(current_iter, dataset_name, tb_logger)
 
+    @staticmethod
+    def _quantize(img):
+        """Round images in [0, 1] to the 256 levels of uint8, on device."""
+        return img.float().clamp(0, 1).mul(255.).round().div(255.)
+
+    @staticmethod
+    def _to_numpy_images(img):
+        """Convert quantized RGB images (n, c, h, w) to a list of uint8 BGR
+        images (h, w, c), the same as tensor2img. Only uint8 data leaves the
+        device."""
+        img = img.mul(255.).round().to(torch.uint8).flip(1).permute(0, 2, 3, 1).cpu().numpy()
+        return list(img)
+
     def _log_validation_metric_values(self, current_iter, dataset_name, tb_logger):
         log_str = f'Validation {dataset_name}\n'
         for metric, value in self.metric_results.items():
@@ -1,7 +1,7 @@
 from .deform_conv import (DeformConv, DeformConvPack, ModulatedDeformConv, ModulatedDeformConvPack, deform_conv,
-                          modulated_deform_conv)
+                          deform_conv_native, modulated_deform_conv)
 
 __all__ = [
     'DeformConv', 'DeformConvPack', 'ModulatedDeformConv', 'ModulatedDeformConvPack', 'deform_conv',
-    'modulated_deform_conv'
+    'modulated_deform_conv', 'deform_conv_native'
 ]
@@ -22,6 +22,9 @@ except ImportError:
                 os.path.join(module_path, 'src', 'deform_conv_cuda_kernel.cu'),
             ],
         )
+    else:
+        # use the pure PyTorch implementation (deform_conv_native)
+        deform_conv_ext = None
 
 
 class DeformConvFunction(Function):
@@ -179,8 +182,112 @@ class ModulatedDeformConvFunction(Function):
         return n, channels_out, height_out, width_out
 
 
-deform_conv = DeformConvFunction.apply
-modulated_deform_conv = ModulatedDeformConvFunction.apply
+def deform_conv_native(input,
+                       offset,
+                       mask,
+                       weight,
+                       bias=None,
+                       stride=1,
+                       padding=0,
+                       dilation=1,
+                       groups=1,
+                       deformable_groups=1):
+    """(Modulated) deformable convolution in pure PyTorch.
+
+    It is the reference implementation, used on CPU or when the CUDA
+    extension is not available. All the kernel positions are sampled at once
+    with ``grid_sample`` (bilinear, zero outside the image, the same as the
+    CUDA im2col), and the convolution is a batched matmul with the columns.
+    It is differentiable by autograd.
+
+    Args:
+        input (Tensor): Input with shape (n, c, h, w).
+        offset (Tensor): Offsets with shape (n, dg * 2 * kh * kw, h_out,
+            w_out), ordered as (dg, kh * kw, (y, x)).
+        mask (Tensor | None): Modulation masks with shape (n, dg * kh * kw,
+            h_out, w_out). None for deformable convolution v1.
+        weight (Tensor): Weight with shape (c_out, c // groups, kh, kw).
+        bias (Tensor | None): Bias with shape (c_out, ). Default: None.
+
+    Returns:
+        Tensor: Output with shape (n, c_out, h_out, w_out).
+    """
+    stride_h, stride_w = _pair(stride)
+    pad_h, pad_w = _pair(padding)
+    dil_h, dil_w = _pair(dilation)
+    n, c, h, w = input.shape
+    c_out, _, kernel_h, kernel_w = weight.shape
+    num_k = kernel_h * kernel_w
+    h_out = (h + 2 * pad_h - (dil_h * (kernel_h - 1) + 1)) // stride_h + 1
+    w_out = (w + 2 * pad_w - (dil_w * (kernel_w - 1) + 1)) // stride_w + 1
+
+    # sampling positions of every kernel point, (n, dg, k, h_out, w_out)
+    ky, kx = torch.meshgrid(
+        torch.arange(kernel_h, device=input.device) * dil_h,
+        torch.arange(kernel_w, device=input.device) * dil_w,
+        indexing='ij')
+    oy = torch.arange(h_out, device=input.device) * stride_h - pad_h
+    ox = torch.arange(w_out, device=input.device) * stride_w - pad_w
+    base_y = (ky.reshape(-1, 1, 1) + oy.view(1, -1, 1)).to(input.dtype)
+    base_x = (kx.reshape(-1, 1, 1) + ox.view(1, 1, -1)).to(input.dtype)
+    offset = offset.view(n, deformable_groups, num_k, 2, h_out, w_out)
+    pos_y = base_y + offset[:, :, :, 0]
+    pos_x = base_x + offset[:, :, :, 1]
+
+    # pixel centers in the normalized coordinates of align_corners=False,
+    # which stay correct for a size of 1 (unlike align_corners=True)
+    grid = torch.stack([(pos_x + 0.5) * (2 / w) - 1, (pos_y + 0.5) * (2 / h) - 1], dim=-1)
+    grid = grid.view(n * deformable_groups, num_k * h_out, w_out, 2)
+    columns = F.grid_sample(
+        input.reshape(n * deformable_groups, c // deformable_groups, h, w),
+        grid,
+        mode='bilinear',
+        padding_mode='zeros',
+        align_corners=False)
+    columns = columns.view(n, deformable_groups, c // deformable_groups, num_k, h_out * w_out)
+    if mask is not None:
+        columns = columns * mask.view(n, deformable_groups, 1, num_k, h_out * w_out)
+
+    # convolution as a matmul of the weight with the columns, per group
+    columns = columns.reshape(n, groups, c // groups * num_k, h_out * w_out)
+    weight = weight.reshape(groups, c_out // groups, c // groups * num_k)
+    output = torch.matmul(weight, columns).view(n, c_out, h_out, w_out)
+    if bias is not None:
+        output = output + bias.view(1, -1, 1, 1)
+    return output
+
+
+def deform_conv(input,
+                offset,
+                weight,
+                stride=1,
+                padding=0,
+                dilation=1,
+                groups=1,
+                deformable_groups=1,
+                im2col_step=64):
+    if deform_conv_ext is None or not input.is_cuda:
+        return deform_conv_native(input, offset, None, weight, None, stride, padding, dilation, groups,
+                                  deformable_groups)
+    return DeformConvFunction.apply(input, offset, weight, stride, padding, dilation, groups, deformable_groups,
+                                    im2col_step)
+
+
+def modulated_deform_conv(input,
+                          offset,
+                          mask,
+                          weight,
+                          bias=None,
+                          stride=1,
+                          padding=0,
+                          dilation=1,
+                          groups=1,
+                          deformable_groups=1):
+    if deform_conv_ext is None or not input.is_cuda:
+        return deform_conv_native(input, offset, mask, weight, bias, stride, padding, dilation, groups,
+                                  deformable_groups)
+    return ModulatedDeformConvFunction.apply(input, offset, mask, weight, bias, stride, padding, dilation, groups,
+                                             deformable_groups)
 
 
 class DeformConv(nn.Module):
@@ -3,6 +3,7 @@
 import torch
 from torch import nn
 from torch.autograd import Function
+from torch.nn import functional as F
 
 try:
     from . import fused_act_ext
@@ -19,6 +20,9 @@ except ImportError:
                 os.path.join(module_path, 'src', 'fused_bias_act_kernel.cu'),
             ],
         )
+    else:
+        # use the pure PyTorch implementation (fused_leaky_relu_native)
+        fused_act_ext = None
 
 
 class FusedLeakyReLUFunctionBackward(Function):
@@ -86,4 +90,12 @@ class FusedLeakyReLU(nn.Module):
 
 
 def fused_leaky_relu(input, bias, negative_slope=0.2, scale=2**0.5):
+    if fused_act_ext is None or input.device.type == 'cpu':
+        return fused_leaky_relu_native(input, bias, negative_slope, scale)
     return FusedLeakyReLUFunction.apply(input, bias, negative_slope, scale)
+
+
+def fused_leaky_relu_native(input, bias, negative_slope=0.2, scale=2**0.5):
+    # bias is added along dim 1
+    rest_dim = [1] * (input.ndim - bias.ndim - 1)
+    return F.leaky_relu(input + bias.view(1, bias.shape[0], *rest_dim), negative_slope=negative_slope) * scale
@@ -19,6 +19,9 @@ except ImportError:
                 os.path.join(module_path, 'src', 'upfirdn2d_kernel.cu'),
             ],
         )
+    else:
+        # use the pure PyTorch implementation (upfirdn2d_native)
+        upfirdn2d_ext = None
 
 
 class UpFirDn2dBackward(Function):
@@ -145,7 +148,7 @@ class UpFirDn2d(Function):
 
 
 def upfirdn2d(input, kernel, up=1, down=1, pad=(0, 0)):
-    if input.device.type == 'cpu':
+    if upfirdn2d_ext is None or input.device.type == 'cpu':
         out = upfirdn2d_native(input, kernel, up, up, down, down, pad[0], pad[1], pad[0], pad[1])
     else:
         out = UpFirDn2d.apply(input, kernel, (up, up), (down, down), (pad[0], pad[1], pad[0], pad[1]))
@@ -1,7 +1,11 @@
+from .dir_index import DirectoryIndex, scandir_cached
 from .file_client import FileClient
-from .img_util import crop_border, imfrombytes, img2tensor, imwrite, tensor2img
+from .img_util import (AsyncImageWriter, TensorToImage, crop_border, imfrombytes, img2tensor, imwrite, tensor2img,
+                       tensor2img_fast)
 from .logger import MessageLogger, get_env_info, get_root_logger, init_tb_logger, init_wandb_logger
-from .misc import check_resume, get_time_str, make_exp_dirs, mkdir_and_rename, scandir, set_random_seed, sizeof_fmt
+from .misc import (check_resume, get_time_str, load_checkpoint, make_exp_dirs, mkdir_and_rename, scandir, set_random_seed,
+                   sizeof_fmt)
+from .result_cache import ResultCache, file_hash
 
 __all__ = [
 
@@ -11,5 +15,6 @@ __all__ = [
     'imfrombytes',
     'imwrite',
     'crop_border',
+    'AsyncImageWriter',
 
 ]
@@ -0,0 +1,116 @@
+import atexit
+import os
+import queue
+import threading
+import torch
+
+from .logger import get_root_logger
+
+
+class CheckpointWriter(object):
+    """Write checkpoints atomically, optionally in a background thread.
+
+    An asynchronous save first takes a snapshot of the state in the caller
+    thread: CUDA tensors are copied into pinned host buffers (reused across
+    saves) with one synchronization, CPU tensors are cloned. Training can then
+    go on while the snapshot is serialized with ``torch.save``. Checkpoints are
+    written to a temporary file, which is renamed to the final path only when
+    complete, so a crash never leaves a truncated checkpoint.
+
+    At most one save is in flight: a new save waits for the previous one to
+    finish (backpressure), which also bounds the host memory to one snapshot.
+
+    Args:
+        async_write (bool): Serialize and write in a background thread.
+            Default: True.
+        keep_last (int): Keep only the last N checkpoints of each group
+            written by this writer. 0 for keeping all. Default: 0.
+    """
+
+    def __init__(self, async_write=True, keep_last=0):
+        self.async_write = async_write
+        self.keep_last = keep_last
+        self._buffers = {}
+        self._history = {}
+        self._error = None
+        if self.async_write:
+            self._queue = queue.Queue(1)
+            self._idle = threading.Event()
+            self._idle.set()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            atexit.register(self.wait)
+
+    def _snapshot(self, obj, key):
+        if torch.is_tensor(obj):
+            if obj.is_cuda:
+                buffer = self._buffers.get(key)
+                if buffer is None or buffer.shape != obj.shape or buffer.dtype != obj.dtype:
+                    buffer = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=True)
+                    self._buffers[key] = buffer
+                return buffer.copy_(obj.detach(), non_blocking=True)
+            return obj.detach().clone()
+        if isinstance(obj, dict):
+            return type(obj)((k, self._snapshot(v, key + (k, ))) for k, v in obj.items())
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self._snapshot(v, key + (i, )) for i, v in enumerate(obj))
+        return obj
+
+    def _write(self, state, save_path, group):
+        tmp_path = f'{save_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            torch.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, save_path)
+
+        if group is not None and self.keep_last > 0:
+            history = self._history.setdefault(group, [])
+            if save_path in history:
+                history.remove(save_path)
+            history.append(save_path)
+            while len(history) > self.keep_last:
+                old_path = history.pop(0)
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+
+    def _run(self):
+        while True:
+            state, save_path, group = self._queue.get()
+            try:
+                self._write(state, save_path, group)
+            except Exception as error:  # re-raised in the training thread
+                self._error = error
+                get_root_logger().error(f'Failed to save checkpoint {save_path}: {error}')
+            finally:
+                self._idle.set()
+
+    def save(self, state, save_path, group=None):
+        """Save a state.
+
+        Args:
+            state (dict): State to be saved, e.g., a state dict.
+            save_path (str): Path of the checkpoint.
+            group (str | None): Group of the checkpoint for ``keep_last``,
+                e.g., the network label. None for never removing it.
+                Default: None.
+        """
+        self.wait()
+        if not self.async_write:
+            self._write(state, save_path, group)
+            return
+        # the buffers are free, as the previous write is done
+        state = self._snapshot(state, (group, ))
+        if torch.cuda.is_available():
+            torch.cuda.current_stream().synchronize()
+        self._idle.clear()
+        self._queue.put((state, save_path, group))
+
+    def wait(self):
+        """Wait for the pending save, and raise its error if it failed."""
+        if self.async_write:
+            self._idle.wait()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
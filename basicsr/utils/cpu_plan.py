@@ -0,0 +1,108 @@
+import numpy as np
+import os
+import torch
+from collections import namedtuple
+
+CpuPlan = namedtuple('CpuPlan', ['num_workers', 'num_threads', 'cpus'])
+CpuPlan.__doc__ = """CPU execution plan: ``num_workers`` processes with
+``num_threads`` intra-op threads each. ``cpus[i]`` are the cpu ids worker i is
+pinned to."""
+
+
+def get_cpu_topology():
+    """Physical cores available to this process, grouped by socket.
+
+    Only the first hardware thread of each core is kept: the SMT siblings share
+    the FP units of a core, so they add little to conv and matmul throughput.
+    Without the sysfs topology (e.g., not on Linux), every cpu counts as a
+    core of one socket.
+
+    Returns:
+        list[list[int]]: Cpu ids per socket.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    sockets, cores = {}, set()
+    for cpu in cpus:
+        topology = f'/sys/devices/system/cpu/cpu{cpu}/topology'
+        try:
+            with open(f'{topology}/physical_package_id', 'r') as f:
+                socket = int(f.read())
+            with open(f'{topology}/core_id', 'r') as f:
+                core = int(f.read())
+        except (OSError, ValueError):
+            socket, core = 0, cpu
+        if (socket, core) not in cores:
+            cores.add((socket, core))
+            sockets.setdefault(socket, []).append(cpu)
+    return [sockets[socket] for socket in sorted(sockets)]
+
+
+def plan_cpu_execution(areas, sockets=None, num_workers=None, num_threads=None, pixels_per_thread=128 * 128):
+    """Plan the CPU inference of a set of images.
+
+    The small-channel convs scale poorly over intra-op threads on small
+    images, while large images keep many threads busy. So each worker gets
+    about one thread per ``pixels_per_thread`` pixels of the median image,
+    rounded down to a divisor of the socket size so that no worker spans two
+    sockets, and the cores are filled with as many workers as there are
+    images for. Cores left idle for lack of images go to the intra-op threads.
+
+    Args:
+        areas (list[float]): Image areas (h * w).
+        sockets (list[list[int]] | None): Cpu ids per socket. None for
+            :func:`get_cpu_topology`. Default: None.
+        num_workers (int | None): Number of worker processes. None for
+            planning it. Default: None.
+        num_threads (int | None): Number of intra-op threads per worker. None
+            for planning it. Default: None.
+        pixels_per_thread (int): Pixels per intra-op thread.
+            Default: 128 * 128.
+
+    Returns:
+        CpuPlan: The plan.
+    """
+    if sockets is None:
+        sockets = get_cpu_topology()
+    cpus = [cpu for socket in sockets for cpu in socket]
+    num_cores = len(cpus)
+    socket_size = max(len(socket) for socket in sockets)
+
+    if num_threads is None:
+        if num_workers is not None:
+            num_threads = max(num_cores // num_workers, 1)
+        else:
+            area = float(np.median(areas)) if len(areas) > 0 else pixels_per_thread
+            num_threads = int(min(max(area // pixels_per_thread, 1), socket_size))
+            while socket_size % num_threads:
+                num_threads -= 1
+            num_workers = max(min(num_cores // num_threads, len(areas)), 1)
+            num_threads = max(num_threads, num_cores // num_workers)
+    elif num_workers is None:
+        num_workers = max(min(num_cores // num_threads, len(areas)), 1)
+
+    # consecutive cores in socket order, wrapping around when oversubscribed
+    worker_cpus = [[cpus[(i * num_threads + j) % num_cores] for j in range(num_threads)] for i in range(num_workers)]
+    return CpuPlan(num_workers, num_threads, worker_cpus)
+
+
+def apply_cpu_plan(plan, worker_id=0):
+    """Pin the calling process to the cores of a worker and set its threads.
+
+    Call it before any parallel torch work: only the threads created after it
+    inherit the affinity.
+
+    Args:
+        plan (CpuPlan): The plan.
+        worker_id (int): Index of the worker in the plan. Default: 0.
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, plan.cpus[worker_id])
+    torch.set_num_threads(plan.num_threads)
+    try:
+        # Net has no inter-op parallelism to exploit
+        torch.set_num_interop_threads(1)
+    except RuntimeError:  # already set, or parallel work has already started
+        pass
@@ -0,0 +1,232 @@
+import json
+import os
+import struct
+from os import path as osp
+
+from .logger import get_root_logger
+
+INDEX_VERSION = 1
+INDEX_FILENAME = '.scandir_index.json'
+
+
+def read_image_size(path):
+    """Read the size of a PNG / JPEG / BMP image from its header.
+
+    Only the header is read, so it is much cheaper than decoding the image.
+
+    Args:
+        path (str): Image path.
+
+    Returns:
+        tuple[int] | None: (h, w), or None if the format is not supported.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(26)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+            w, h = struct.unpack('>II', head[16:24])
+            return h, w
+        if head[:2] == b'BM':
+            w, h = struct.unpack('<ii', head[18:26])
+            return abs(h), w
+        if head[:2] == b'\xff\xd8':
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                # SOF markers, except DHT (C4), JPG (C8) and DAC (CC)
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    h, w = struct.unpack('>HH', f.read(7)[3:7])
+                    return h, w
+                length = struct.unpack('>H', f.read(2))[0]
+                f.seek(length - 2, 1)
+    return None
+
+
+class DirectoryIndex(object):
+    """Persistent index of a directory tree.
+
+    Walking a large tree on a network filesystem is slow. The index stores,
+    for each directory, its mtime, sub-directories and files (size, mtime and
+    image shape) in a json file. The listing is validated incrementally: a
+    directory is only listed again when its mtime changed (i.e., entries were
+    added, removed or renamed in it), so an unchanged tree costs one ``stat``
+    per directory instead of a full listing. A file rewritten in place does not
+    change the mtime of its directory, so :meth:`get_info` stats the file again
+    before serving its info, and only reads the image header of new or
+    modified files.
+
+    Args:
+        root (str): Root of the directory tree.
+        index_path (str | None): Path of the index file. None for
+            ``{root}/.scandir_index.json``, which ``scandir`` skips as a
+            hidden file. Default: None.
+    """
+
+    def __init__(self, root, index_path=None):
+        self.root = osp.abspath(root)
+        self.index_path = osp.join(self.root, INDEX_FILENAME) if index_path is None else index_path
+        self.dirs = {}
+        self.changed = False
+        if osp.isfile(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+                if index.get('version') == INDEX_VERSION and index.get('root') == self.root:
+                    self.dirs = index['dirs']
+            except (OSError, ValueError):
+                get_root_logger().warning(f'Ignore broken directory index: {self.index_path}')
+
+    def _update_dir(self, rel_dir):
+        """Return the up-to-date record of a directory, listing it again only
+        if its mtime changed."""
+        dir_path = osp.join(self.root, rel_dir)
+        mtime = os.stat(dir_path).st_mtime_ns
+        record = self.dirs.get(rel_dir)
+        if record is not None and record['mtime'] == mtime:
+            return record
+
+        old_files = {} if record is None else record['files']
+        files, subdirs = {}, []
+        for entry in os.scandir(dir_path):
+            if not entry.name.startswith('.') and entry.is_file():
+                stat = entry.stat()
+                old = old_files.get(entry.name)
+                # keep the cached shape if the file is not modified
+                if old is not None and old[0] == stat.st_size and old[1] == stat.st_mtime_ns:
+                    files[entry.name] = old
+                else:
+                    files[entry.name] = [stat.st_size, stat.st_mtime_ns, None]
+            elif entry.is_dir():
+                subdirs.append(entry.name)
+        record = {'mtime': mtime, 'files': files, 'subdirs': subdirs}
+        self.dirs[rel_dir] = record
+        self.changed = True
+        return record
+
+    def scan(self, suffix=None, recursive=False, full_path=False):
+        """Scan the indexed tree in the same way as :func:`scandir`.
+
+        Args:
+            suffix (str | tuple(str), optional): File suffix that we are
+                interested in. Default: None.
+            recursive (bool, optional): If set to True, recursively scan the
+                directory. Default: False.
+            full_path (bool, optional): If set to True, include the root.
+                Default: False.
+
+        Returns:
+            list[str]: The interested files.
+        """
+        if (suffix is not None) and not isinstance(suffix, (str, tuple)):
+            raise TypeError('"suffix" must be a string or tuple of strings')
+
+        paths = []
+        pending = ['']
+        while pending:
+            rel_dir = pending.pop(0)
+            record = self._update_dir(rel_dir)
+            for name in record['files']:
+                rel_path = osp.join(rel_dir, name)
+                if suffix is not None and not rel_path.endswith(suffix):
+                    continue
+                paths.append(osp.join(self.root, rel_path) if full_path else rel_path)
+            if recursive:
+                pending.extend(osp.join(rel_dir, name) for name in record['subdirs'])
+        return paths
+
+    def get_info(self, path, with_shape=False):
+        """Get the info of an indexed file.
+
+        The file is stat-ed again, and its info refreshed if it was modified.
+
+        Args:
+            path (str): File path, relative to the root or full.
+            with_shape (bool, optional): If set to True, read the image shape
+                from the header if it is not indexed yet. Default: False.
+
+        Returns:
+            dict | None: Dict with 'size', 'mtime' (ns) and 'shape' ((h, w) or
+                None), or None if the file is not indexed.
+        """
+        rel_path = osp.relpath(osp.abspath(path), self.root) if osp.isabs(path) else path
+        rel_dir, name = osp.split(rel_path)
+        record = self.dirs.get(rel_dir)
+        if record is None or name not in record['files']:
+            return None
+        info = record['files'][name]
+        stat = os.stat(osp.join(self.root, rel_path))
+        if info[0] != stat.st_size or info[1] != stat.st_mtime_ns:
+            info[:] = [stat.st_size, stat.st_mtime_ns, None]
+            self.changed = True
+        if with_shape and info[2] is None:
+            info[2] = read_image_size(osp.join(self.root, rel_path))
+            self.changed = True
+        size, mtime, shape = info
+        return {'size': size, 'mtime': mtime, 'shape': None if shape is None else tuple(shape)}
+
+    def save(self):
+        """Write the index file if it changed. A read-only tree only costs a
+        warning, and the index then lives in memory only."""
+        if not self.changed:
+            return
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'root': self.root, 'dirs': self.dirs}, f)
+            # atomic, so that concurrent ranks never read a half-written index
+            os.replace(tmp_path, self.index_path)
+            self.changed = False
+        except OSError as error:
+            get_root_logger().warning(f'Cannot save directory index {self.index_path}: {error}')
+
+
+def read_image_sizes(paths, index=None):
+    """Read the (h, w) of images, through a :class:`DirectoryIndex` if given.
+
+    With an index, the shapes are read from the image headers only once and
+    then served from the index (one ``stat`` per image); the index is saved
+    afterwards. Images outside the index are read from their headers.
+
+    Args:
+        paths (list[str]): Image paths.
+        index (DirectoryIndex | None): Index of a tree holding the images.
+            Default: None.
+
+    Returns:
+        list[tuple[int] | None]: (h, w) of each image, None if the format is
+            not supported.
+    """
+    if index is None:
+        return [read_image_size(path) for path in paths]
+    sizes = []
+    for path in paths:
+        info = index.get_info(osp.relpath(path, index.root), with_shape=True)
+        sizes.append(read_image_size(path) if info is None else info['shape'])
+    index.save()
+    return sizes
+
+
+def scandir_cached(dir_path, suffix=None, recursive=False, full_path=False, index_path=None):
+    """Drop-in replacement of :func:`scandir` backed by a persistent
+    :class:`DirectoryIndex`.
+
+    Args:
+        dir_path (str): Path of the directory.
+        suffix (str | tuple(str), optional): File suffix that we are
+            interested in. Default: None.
+        recursive (bool, optional): If set to True, recursively scan the
+            directory. Default: False.
+        full_path (bool, optional): If set to True, include the dir_path.
+            Default: False.
+        index_path (str | None): Path of the index file. Default: None.
+
+    Returns:
+        list[str]: The interested files.
+    """
+    index = DirectoryIndex(dir_path, index_path=index_path)
+    paths = index.scan(suffix=suffix, recursive=recursive)
+    index.save()
+    if full_path:
+        paths = [osp.join(dir_path, path) for path in paths]
+    return paths
@@ -1,5 +1,6 @@
 # Modified from https://github.com/open-mmlab/mmcv/blob/master/mmcv/runner/dist_utils.py  # noqa: E501
 import functools
+import heapq
 import os
 import subprocess
 import torch
@@ -21,7 +22,9 @@ def init_dist(launcher, backend='nccl', **kwargs):
 def _init_dist_pytorch(backend, **kwargs):
     rank = int(os.environ['RANK'])
     num_gpus = torch.cuda.device_count()
-    torch.cuda.set_device(rank % num_gpus)
+    # CPU-only process groups (gloo) have no device to set
+    if num_gpus > 0:
+        torch.cuda.set_device(rank % num_gpus)
     dist.init_process_group(backend=backend, **kwargs)
 
 
@@ -40,7 +43,8 @@ def _init_dist_slurm(backend, port=None):
     ntasks = int(os.environ['SLURM_NTASKS'])
     node_list = os.environ['SLURM_NODELIST']
     num_gpus = torch.cuda.device_count()
-    torch.cuda.set_device(proc_id % num_gpus)
+    if num_gpus > 0:
+        torch.cuda.set_device(proc_id % num_gpus)
     addr = subprocess.getoutput(f'scontrol show hostname {node_list} | head -n1')
     # specify master port
     if port is not None:
@@ -52,7 +56,7 @@ def _init_dist_slurm(backend, port=None):
         os.environ['MASTER_PORT'] = '29500'
     os.environ['MASTER_ADDR'] = addr
     os.environ['WORLD_SIZE'] = str(ntasks)
-    os.environ['LOCAL_RANK'] = str(proc_id % num_gpus)
+    os.environ['LOCAL_RANK'] = str(proc_id % max(num_gpus, 1))
     os.environ['RANK'] = str(proc_id)
     dist.init_process_group(backend=backend)
 
@@ -80,3 +84,26 @@ def master_only(func):
             return func(*args, **kwargs)
 
     return wrapper
+
+
+def shard_by_cost(costs, num_shards):
+    """Split items into shards with balanced total costs.
+
+    Items are assigned from the most to the least costly, each to the shard
+    with the lowest total cost so far (LPT scheduling). It is deterministic,
+    so every rank computes the same split.
+
+    Args:
+        costs (list[float]): Cost of each item, e.g., the image area.
+        num_shards (int): Number of shards, e.g., the world size.
+
+    Returns:
+        list[list[int]]: Sorted item indices of each shard.
+    """
+    shards = [[] for _ in range(num_shards)]
+    heap = [(0, shard) for shard in range(num_shards)]
+    for idx in sorted(range(len(costs)), key=lambda i: (-costs[i], i)):
+        load, shard = heapq.heappop(heap)
+        shards[shard].append(idx)
+        heapq.heappush(heap, (load + costs[idx], shard))
+    return [sorted(shard) for shard in shards]
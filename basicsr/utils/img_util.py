@@ -2,8 +2,9 @@ import cv2
 import math
 import numpy as np
 import os
+import queue
+import threading
 import torch
-from torchvision.utils import make_grid
 
 
 def img2tensor(imgs, bgr2rgb=True, float32=True):
@@ -68,6 +69,7 @@ def tensor2img(tensor, rgb2bgr=True, out_type=np.uint8, min_max=(0, 1)):
 
         n_dim = _tensor.dim()
         if n_dim == 4:
+            from torchvision.utils import make_grid  # torchvision is slow to import, only needed here
             img_np = make_grid(_tensor, nrow=int(math.sqrt(_tensor.size(0))), normalize=False).numpy()
             img_np = img_np.transpose(1, 2, 0)
             if rgb2bgr:
@@ -98,17 +100,86 @@ def tensor2img_fast(tensor, rgb2bgr=True, min_max=(0, 1)):
     """This implementation is slightly faster than tensor2img.
     It now only supports torch tensor with shape (1, c, h, w).
 
+    The rounding is the same as tensor2img. Use :class:`TensorToImage` to
+    reuse the buffers across calls.
+
     Args:
         tensor (Tensor): Now only support torch tensor with (1, c, h, w).
+            It is modified in place.
         rgb2bgr (bool): Whether to change rgb to bgr. Default: True.
         min_max (tuple[int]): min and max values for clamp.
     """
-    output = tensor.squeeze(0).detach().clamp_(*min_max).permute(1, 2, 0)
-    output = (output - min_max[0]) / (min_max[1] - min_max[0]) * 255
-    output = output.type(torch.uint8).cpu().numpy()
-    if rgb2bgr:
-        output = cv2.cvtColor(output, cv2.COLOR_RGB2BGR)
-    return output
+    return TensorToImage(rgb2bgr=rgb2bgr, min_max=min_max)(tensor)
+
+
+class TensorToImage(object):
+    """Convert image tensors to uint8 numpy images with reusable buffers.
+
+    The clamping, scaling, rounding, uint8 cast and RGB to BGR swap all run
+    on the device of the tensor, in place or into a uint8 buffer, and only the
+    uint8 image is copied to a pinned host buffer. The buffers grow to the
+    largest image seen and are reused, so converting a frame allocates no
+    full-image float copy. The result is the same as :func:`tensor2img`.
+
+    Args:
+        rgb2bgr (bool): Whether to change rgb to bgr. Default: True.
+        min_max (tuple[int]): min and max values for clamp. Default: (0, 1).
+    """
+
+    def __init__(self, rgb2bgr=True, min_max=(0, 1)):
+        self.rgb2bgr = rgb2bgr
+        self.min_max = min_max
+        self._buffers = {}
+
+    def _buffer(self, device, numel):
+        buffer = self._buffers.get(device)
+        if buffer is None or buffer.numel() < numel:
+            pin_memory = device.type == 'cpu' and torch.cuda.is_available()
+            buffer = torch.empty(numel, dtype=torch.uint8, device=device, pin_memory=pin_memory)
+            self._buffers[device] = buffer
+        return buffer[:numel]
+
+    def __call__(self, tensor):
+        """Convert an image tensor.
+
+        Args:
+            tensor (Tensor): Shape (1, c, h, w) or (c, h, w), on any device,
+                in any memory format and floating-point dtype. A float32
+                tensor is modified in place.
+
+        Returns:
+            ndarray: Image with shape (h, w, c), or (h, w) for gray images.
+                It is a view of the host buffer, only valid until the next
+                call, so copy it if it is kept.
+        """
+        # as tensor2img, so that half precision outputs (e.g., AMP) are not
+        # scaled and rounded in half precision; a no-op for float32
+        img = tensor.detach().float()
+        if img.dim() == 4:
+            img = img.squeeze(0)
+        c, h, w = img.shape
+        # the same float ops as tensor2img, so that the rounding is the same
+        img = img.clamp_(*self.min_max)
+        if self.min_max != (0, 1):
+            img = img.sub_(self.min_max[0]).div_(self.min_max[1] - self.min_max[0])
+        img = img.mul_(255.).round_()
+
+        # cast and reorder the channels into the (h, w, c) device buffer
+        out = self._buffer(img.device, c * h * w).view(h, w, c)
+        out_chw = out.permute(2, 0, 1)
+        if self.rgb2bgr and c == 3:
+            for i in range(c):
+                out_chw[i].copy_(img[c - 1 - i])
+        else:
+            out_chw.copy_(img)
+
+        if out.device.type != 'cpu':
+            host = self._buffer(torch.device('cpu'), c * h * w).view(h, w, c)
+            host.copy_(out, non_blocking=True)
+            torch.cuda.current_stream(out.device).synchronize()
+            out = host
+        out = out.numpy()
+        return out[:, :, 0] if c == 1 else out
 
 
 def imfrombytes(content, flag='color', float32=False):
@@ -151,6 +222,51 @@ def imwrite(img, file_path, params=None, auto_mkdir=True):
     return cv2.imwrite(file_path, img, params)
 
 
+class AsyncImageWriter(object):
+    """Write images with :func:`imwrite` in background threads.
+
+    PNG encoding and disk writes release the GIL, so the caller (e.g., the
+    validation loop) keeps the GPU busy while the images are written.
+
+    Args:
+        num_workers (int): Number of writer threads. Default: 1.
+        max_queue (int): Max number of pending images. ``write`` blocks when
+            the queue is full, which bounds the memory. Default: 64.
+    """
+
+    def __init__(self, num_workers=1, max_queue=64):
+        self._queue = queue.Queue(max_queue)
+        self._errors = []
+        self._workers = [threading.Thread(target=self._run, daemon=True) for _ in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            img, file_path, params = item
+            try:
+                if not imwrite(img, file_path, params):
+                    raise IOError(f'Failed in writing images: {file_path}')
+            except Exception as error:  # re-raised in close()
+                self._errors.append(error)
+
+    def write(self, img, file_path, params=None):
+        """Queue an image for writing. Same arguments as :func:`imwrite`."""
+        self._queue.put((img, file_path, params))
+
+    def close(self):
+        """Wait for all the pending images and stop the workers."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        if self._errors:
+            raise self._errors[0]
+
+
 def crop_border(imgs, crop_border):
     """Crop borders of images.
 
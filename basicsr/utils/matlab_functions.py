@@ -1,3 +1,4 @@
+import functools
 import math
 import numpy as np
 import torch
@@ -82,6 +83,35 @@ def calculate_weights_indices(in_length, out_length, scale, kernel, kernel_width
     return weights, indices, int(sym_len_s), int(sym_len_e)
 
 
+@functools.lru_cache(maxsize=32)
+def resize_matrix(in_length, out_length, scale, antialiasing):
+    """Dense (out_length, in_length) bicubic resize matrix, same as MATLAB.
+
+    It folds the weights of :func:`calculate_weights_indices` and the
+    symmetric padding of the borders into one matrix, so that resizing along
+    a dimension is a single matmul. The matrices are cached per
+    (size, scale).
+
+    Args:
+        in_length (int): Input length.
+        out_length (int): Output length.
+        scale (float): Scale factor.
+        antialisaing (bool): Whether to apply anti-aliasing when downsampling.
+
+    Returns:
+        Tensor: Resize matrix on CPU, float32.
+    """
+    weights, indices, sym_len_s, _ = calculate_weights_indices(in_length, out_length, scale, 'cubic', 4, antialiasing)
+    # indices are in the symmetrically padded input, map them back
+    pos = indices.long() - sym_len_s
+    pos = torch.where(pos < 0, -pos - 1, pos)
+    pos = torch.where(pos >= in_length, 2 * in_length - pos - 1, pos)
+    rows = torch.arange(out_length).view(-1, 1).expand_as(pos)
+    matrix = torch.zeros(out_length, in_length)
+    matrix.index_put_((rows.reshape(-1), pos.reshape(-1)), weights.reshape(-1), accumulate=True)
+    return matrix
+
+
 @torch.no_grad()
 def imresize(img, scale, antialiasing=True):
     """imresize function same as MATLAB.
@@ -89,9 +119,13 @@ def imresize(img, scale, antialiasing=True):
     It now only supports bicubic.
     The same scale applies for both height and width.
 
+    Both passes are batched matmuls with the cached matrices of
+    :func:`resize_matrix`, on the device of the input tensor.
+
     Args:
         img (Tensor | Numpy array):
-            Tensor: Input image with shape (c, h, w), [0, 1] range.
+            Tensor: Input image with shape (c, h, w) or (n, c, h, w), [0, 1]
+                range.
             Numpy: Input image with shape (h, w, c), [0, 1] range.
         scale (float): Scale factor. The same scale applies for both height
             and width.
@@ -99,71 +133,27 @@ def imresize(img, scale, antialiasing=True):
             Default: True.
 
     Returns:
-        Tensor: Output image with shape (c, h, w), [0, 1] range, w/o round.
+        Tensor: Output image with shape (c, h, w) or (n, c, h, w), [0, 1]
+            range, w/o round.
     """
     if type(img).__module__ == np.__name__:  # numpy type
         numpy_type = True
         img = torch.from_numpy(img.transpose(2, 0, 1)).float()
     else:
         numpy_type = False
+        img = img.float()
 
-    in_c, in_h, in_w = img.size()
+    in_h, in_w = img.shape[-2:]
     out_h, out_w = math.ceil(in_h * scale), math.ceil(in_w * scale)
-    kernel_width = 4
-    kernel = 'cubic'
-
-    # get weights and indices
-    weights_h, indices_h, sym_len_hs, sym_len_he = calculate_weights_indices(in_h, out_h, scale, kernel, kernel_width,
-                                                                             antialiasing)
-    weights_w, indices_w, sym_len_ws, sym_len_we = calculate_weights_indices(in_w, out_w, scale, kernel, kernel_width,
-                                                                             antialiasing)
-    # process H dimension
-    # symmetric copying
-    img_aug = torch.FloatTensor(in_c, in_h + sym_len_hs + sym_len_he, in_w)
-    img_aug.narrow(1, sym_len_hs, in_h).copy_(img)
-
-    sym_patch = img[:, :sym_len_hs, :]
-    inv_idx = torch.arange(sym_patch.size(1) - 1, -1, -1).long()
-    sym_patch_inv = sym_patch.index_select(1, inv_idx)
-    img_aug.narrow(1, 0, sym_len_hs).copy_(sym_patch_inv)
-
-    sym_patch = img[:, -sym_len_he:, :]
-    inv_idx = torch.arange(sym_patch.size(1) - 1, -1, -1).long()
-    sym_patch_inv = sym_patch.index_select(1, inv_idx)
-    img_aug.narrow(1, sym_len_hs + in_h, sym_len_he).copy_(sym_patch_inv)
-
-    out_1 = torch.FloatTensor(in_c, out_h, in_w)
-    kernel_width = weights_h.size(1)
-    for i in range(out_h):
-        idx = int(indices_h[i][0])
-        for j in range(in_c):
-            out_1[j, i, :] = img_aug[j, idx:idx + kernel_width, :].transpose(0, 1).mv(weights_h[i])
-
-    # process W dimension
-    # symmetric copying
-    out_1_aug = torch.FloatTensor(in_c, out_h, in_w + sym_len_ws + sym_len_we)
-    out_1_aug.narrow(2, sym_len_ws, in_w).copy_(out_1)
-
-    sym_patch = out_1[:, :, :sym_len_ws]
-    inv_idx = torch.arange(sym_patch.size(2) - 1, -1, -1).long()
-    sym_patch_inv = sym_patch.index_select(2, inv_idx)
-    out_1_aug.narrow(2, 0, sym_len_ws).copy_(sym_patch_inv)
-
-    sym_patch = out_1[:, :, -sym_len_we:]
-    inv_idx = torch.arange(sym_patch.size(2) - 1, -1, -1).long()
-    sym_patch_inv = sym_patch.index_select(2, inv_idx)
-    out_1_aug.narrow(2, sym_len_ws + in_w, sym_len_we).copy_(sym_patch_inv)
-
-    out_2 = torch.FloatTensor(in_c, out_h, out_w)
-    kernel_width = weights_w.size(1)
-    for i in range(out_w):
-        idx = int(indices_w[i][0])
-        for j in range(in_c):
-            out_2[j, :, i] = out_1_aug[j, :, idx:idx + kernel_width].mv(weights_w[i])
+
+    weights_h = resize_matrix(in_h, out_h, scale, antialiasing).to(img.device)
+    weights_w = resize_matrix(in_w, out_w, scale, antialiasing).to(img.device)
+    # process H dimension, then W dimension
+    out = torch.matmul(torch.matmul(weights_h, img), weights_w.t())
 
     if numpy_type:
-        out_2 = out_2.numpy().transpose(1, 2, 0)
-    return out_2
+        out = out.numpy().transpose(1, 2, 0)
+    return out
 
 
 def rgb2ycbcr(img, y_only=False):
@@ -232,6 +222,33 @@ def bgr2ycbcr(img, y_only=False):
     return out_img
 
 
+def rgb2ycbcr_pt(img, y_only=False):
+    """Convert RGB images to YCbCr images (PyTorch version).
+
+    It implements the ITU-R BT.601 conversion for standard-definition
+    television, in the same way as :func:`rgb2ycbcr`.
+
+    Args:
+        img (Tensor): Images with shape (n, 3, h, w), the range [0, 1],
+            float, RGB format.
+        y_only (bool): Whether to only return Y channel. Default: False.
+
+    Returns:
+        Tensor: Converted images with shape (n, 3/1, h, w), the range [0, 1],
+            float.
+    """
+    if y_only:
+        weight = torch.tensor([[65.481], [128.553], [24.966]]).to(img)
+        out_img = torch.matmul(img.permute(0, 2, 3, 1), weight).permute(0, 3, 1, 2) + 16.0
+    else:
+        weight = torch.tensor([[65.481, -37.797, 112.0], [128.553, -74.203, -93.786], [24.966, 112.0, -18.214]]).to(img)
+        bias = torch.tensor([16, 128, 128]).view(1, 3, 1, 1).to(img)
+        out_img = torch.matmul(img.permute(0, 2, 3, 1), weight).permute(0, 3, 1, 2) + bias
+
+    out_img = out_img / 255.
+    return out_img
+
+
 def ycbcr2rgb(img):
     """Convert a YCbCr image to RGB image.
 
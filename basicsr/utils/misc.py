@@ -3,6 +3,7 @@ import os
 import random
 import time
 import torch
+from collections import OrderedDict
 from os import path as osp
 
 from .dist_util import master_only
@@ -81,11 +82,9 @@ def scandir(dir_path, suffix=None, recursive=False, full_path=False):
                     yield return_path
                 elif return_path.endswith(suffix):
                     yield return_path
-            else:
-                if recursive:
-                    yield from _scandir(entry.path, suffix=suffix, recursive=recursive)
-                else:
-                    continue
+            elif recursive and entry.is_dir():
+                # hidden files (e.g., index or cache files) are skipped
+                yield from _scandir(entry.path, suffix=suffix, recursive=recursive)
 
     return _scandir(dir_path, suffix=suffix, recursive=recursive)
 
@@ -132,3 +131,38 @@ def sizeof_fmt(size, suffix='B'):
             return f'{size:3.1f} {unit}{suffix}'
         size /= 1024.0
     return f'{size:3.1f} Y{suffix}'
+
+
+def load_checkpoint(load_path, param_key='params', mmap=True):
+    """Load a state dict from a checkpoint, on CPU.
+
+    With mmap, the tensors of checkpoints in the zip format (the default of
+    ``torch.save``) are memory-mapped instead of read, so loading costs little
+    more than opening the file. The 'module.' prefixes are stripped without
+    copying the tensors.
+
+    Args:
+        load_path (str): Path of the checkpoint.
+        param_key (str | None): Key of the state dict in the checkpoint. If it
+            does not exist, 'params' is used. None for the whole checkpoint.
+            Default: 'params'.
+        mmap (bool): Memory-map the checkpoint. Legacy (non-zip) checkpoints
+            fall back to a normal load. Default: True.
+
+    Returns:
+        OrderedDict: The state dict.
+    """
+    try:
+        load_net = torch.load(load_path, map_location='cpu', mmap=mmap)
+    except RuntimeError:
+        if not mmap:
+            raise
+        # legacy checkpoints cannot be memory-mapped
+        load_net = torch.load(load_path, map_location='cpu')
+    if param_key is not None:
+        if param_key not in load_net and 'params' in load_net:
+            param_key = 'params'
+            get_root_logger().info('Loading: params_ema does not exist, use params.')
+        load_net = load_net[param_key]
+    # remove unnecessary 'module.'
+    return OrderedDict((k[7:] if k.startswith('module.') else k, v) for k, v in load_net.items())
@@ -1,4 +1,6 @@
 # Modified from: https://github.com/facebookresearch/fvcore/blob/master/fvcore/common/registry.py  # noqa: E501
+import importlib
+import re
 
 
 class Registry():
@@ -25,15 +27,24 @@ class Registry():
     .. code-block:: python
 
         BACKBONE_REGISTRY.register(MyBackbone)
+
+    Modules can also be registered lazily, without importing them, with
+    :meth:`register_lazy`. They are imported on the first :meth:`get` of one
+    of their objects.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, package=None):
         """
         Args:
             name (str): the name of this registry
+            package (str | None): the package that registers the (lazy)
+                modules of this registry, imported on the first lookup
         """
         self._name = name
         self._obj_map = {}
+        self._package = package
+        self._lazy_map = {}
+        self._pattern = re.compile(rf'@{name.upper()}_REGISTRY\.register\(\)\s*\n\s*(?:class|def)\s+(\w+)')
 
     def _do_register(self, name, obj):
         assert (name not in self._obj_map), (f"An object named '{name}' was already registered "
@@ -59,24 +70,55 @@ class Registry():
         name = obj.__name__
         self._do_register(name, obj)
 
+    def register_lazy(self, module_name, file_path):
+        """
+        Register the objects of a module without importing it. The source is
+        scanned for the objects decorated with `@<NAME>_REGISTRY.register()`,
+        and the module is imported on the first `get` of one of them.
+        """
+        with open(file_path, 'r', encoding='latin-1') as f:
+            for name in self._pattern.findall(f.read()):
+                self._lazy_map.setdefault(name, module_name)
+
+    def _load(self, name=None):
+        """
+        Import the module of a lazily registered object, or all the lazy
+        modules if the name is None or unknown (e.g., registered by a call).
+        """
+        if self._package is not None:
+            importlib.import_module(self._package)
+        if name in self._lazy_map:
+            module_names = [self._lazy_map[name]]
+        else:
+            module_names = sorted(set(self._lazy_map.values()))
+        for module_name in module_names:
+            importlib.import_module(module_name)
+
     def get(self, name):
         ret = self._obj_map.get(name)
+        if ret is None:
+            self._load(name)
+            ret = self._obj_map.get(name)
         if ret is None:
             raise KeyError(f"No object named '{name}' found in '{self._name}' registry!")
         return ret
 
     def __contains__(self, name):
-        return name in self._obj_map
+        if self._package is not None:
+            importlib.import_module(self._package)
+        return name in self._obj_map or name in self._lazy_map
 
     def __iter__(self):
+        self._load()
         return iter(self._obj_map.items())
 
     def keys(self):
+        self._load()
         return self._obj_map.keys()
 
 
-DATASET_REGISTRY = Registry('dataset')
-ARCH_REGISTRY = Registry('arch')
-MODEL_REGISTRY = Registry('model')
-LOSS_REGISTRY = Registry('loss')
-METRIC_REGISTRY = Registry('metric')
+DATASET_REGISTRY = Registry('dataset', package='basicsr.data')
+ARCH_REGISTRY = Registry('arch', package='basicsr.archs')
+MODEL_REGISTRY = Registry('model', package='basicsr.models')
+LOSS_REGISTRY = Registry('loss', package='basicsr.losses')
+METRIC_REGISTRY = Registry('metric', package='basicsr.metrics')
@@ -0,0 +1,142 @@
+import glob
+import hashlib
+import json
+import os
+from os import path as osp
+
+from .logger import get_root_logger
+
+INDEX_FILENAME = '.result_cache.json'
+JOURNAL_PATTERN = '.result_cache_rank{}.jsonl'
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA1 of the file content, so that cached results survive renames and
+    touches but not modifications."""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class ResultCache(object):
+    """Content-hash cache of the results of an inference run.
+
+    A result is valid when its input has the same content hash and it was
+    produced with the same settings (e.g., the checkpoint hash and the
+    inference options), and the output file still exists. The input size and
+    mtime are stored as well, so only touched or modified inputs are hashed
+    again; an unchanged folder costs one ``stat`` per image.
+
+    The cache lives in the cache dir as a compacted index
+    (``.result_cache.json``) and append-only journals, one per rank
+    (``.result_cache_rank{rank}.jsonl``). They are hidden files, which
+    ``scandir`` and :class:`DirectoryIndex` skip, so the result root can be
+    scanned (e.g., by ``evaluate.py``) with the cache inside. A record is
+    appended and flushed as soon as its output is written, and a partial last
+    line is ignored when reading, so an interrupted run keeps all its finished
+    results.
+    :meth:`compact` merges the journals into the index.
+
+    Args:
+        input_root (str): Root of the inputs. Records are keyed by the path
+            relative to it.
+        result_root (str): Root of the outputs, with the same layout as the
+            inputs.
+        settings (dict): Everything else the results depend on. Must be json
+            serializable.
+        cache_dir (str | None): Folder of the index and the journals. None
+            for the result root. Default: None.
+    """
+
+    def __init__(self, input_root, result_root, settings, cache_dir=None):
+        self.input_root = input_root
+        self.result_root = result_root
+        self.cache_dir = result_root if cache_dir is None else cache_dir
+        self.key = hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+        self.index_path = osp.join(self.cache_dir, INDEX_FILENAME)
+        self.records = {}
+        self.changed = False
+        self._journal = None
+        self._load()
+
+    def _load(self):
+        if osp.isfile(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    self.records = json.load(f)
+            except (OSError, ValueError):
+                get_root_logger().warning(f'Ignore broken result cache: {self.index_path}')
+        for journal_path in sorted(glob.glob(osp.join(self.cache_dir, JOURNAL_PATTERN.format('*')))):
+            with open(journal_path, 'r') as f:
+                # the last line may be partial if the writer was killed
+                for line in f.read().split('\n')[:-1]:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.records[record.pop('path')] = record
+                    self.changed = True
+
+    def is_done(self, path):
+        """Whether the cached result of an input is still valid.
+
+        Args:
+            path (str): Input path.
+
+        Returns:
+            bool: True if the input can be skipped.
+        """
+        rel_path = osp.relpath(path, self.input_root)
+        record = self.records.get(rel_path)
+        if record is None or record['key'] != self.key or not osp.isfile(osp.join(self.result_root, rel_path)):
+            return False
+        stat = os.stat(path)
+        if record['size'] == stat.st_size and record['mtime'] == stat.st_mtime_ns:
+            return True
+        if file_hash(path) != record['sha1']:
+            return False
+        # touched but not modified: refresh the stat, so it is not hashed again
+        record['size'], record['mtime'] = stat.st_size, stat.st_mtime_ns
+        self.changed = True
+        return True
+
+    def compact(self):
+        """Merge the journals into the index, atomically. Only one process
+        may compact, while no process is writing a journal."""
+        if not self.changed:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.records, f)
+        os.replace(tmp_path, self.index_path)
+        for journal_path in glob.glob(osp.join(self.cache_dir, JOURNAL_PATTERN.format('*'))):
+            os.remove(journal_path)
+        self.changed = False
+
+    def open(self, rank=0):
+        """Open the journal of a rank for :meth:`add`."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._journal = open(osp.join(self.cache_dir, JOURNAL_PATTERN.format(rank)), 'a')
+
+    def add(self, path):
+        """Record the result of an input, once its output is written.
+
+        Args:
+            path (str): Input path.
+        """
+        stat = os.stat(path)
+        record = {'key': self.key, 'sha1': file_hash(path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        rel_path = osp.relpath(path, self.input_root)
+        self.records[rel_path] = record
+        self._journal.write(json.dumps(dict(path=rel_path, **record)) + '\n')
+
+    def flush(self):
+        self._journal.flush()
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
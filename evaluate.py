@@ -0,0 +1,198 @@
+import argparse
+import csv
+import cv2
+import json
+import multiprocessing
+import numpy as np
+import os
+import torch
+from os import path as osp
+
+from basicsr.data.data_util import paired_paths_from_folder
+from basicsr.metrics import calculate_metric
+from basicsr.utils.result_cache import file_hash
+
+
+def build_metric_opts(names, crop_border, test_y_channel):
+    """Build the metric options in the same format as the ``val.metrics``
+    option of the training configs."""
+    types = {'psnr': 'calculate_psnr', 'ssim': 'calculate_ssim', 'lpips': 'calculate_lpips'}
+    metric_opts = {}
+    for name in names:
+        if name not in types:
+            raise ValueError(f'Metric {name} is not supported. Supported ones are: {list(types.keys())}')
+        metric_opts[name] = dict(type=types[name], crop_border=crop_border, test_y_channel=test_y_channel)
+    return metric_opts
+
+
+def init_worker():
+    # one thread per worker, the parallelism comes from the process pool
+    cv2.setNumThreads(1)
+    torch.set_num_threads(1)
+
+
+def score_pair(task):
+    """Calculate the metrics missing in the cache for one pair of images.
+
+    Args:
+        task (tuple): (result_path, gt_path, metric_opts, lpips_device).
+
+    Returns:
+        dict: Metric name to score.
+    """
+    result_path, gt_path, metric_opts, lpips_device = task
+    img = cv2.imread(result_path, cv2.IMREAD_COLOR)
+    img_gt = cv2.imread(gt_path, cv2.IMREAD_COLOR)
+    if img is None or img_gt is None:
+        raise IOError(f'Cannot read image pair: {result_path}, {gt_path}')
+    scores = {}
+    for name, opt in metric_opts.items():
+        metric_data = dict(img1=img, img2=img_gt)
+        if opt['type'] == 'calculate_lpips':
+            # not part of the option, so that it does not change the cache key
+            opt = dict(opt, device=lpips_device)
+        scores[name] = float(np.mean(calculate_metric(metric_data, opt)))
+    return scores
+
+
+def load_cache(cache_path):
+    if osp.isfile(cache_path):
+        try:
+            with open(cache_path, 'r') as f:
+                cache = json.load(f)
+            if 'files' in cache and 'scores' in cache:
+                return cache
+        except (OSError, ValueError):
+            print(f'Ignore broken cache: {cache_path}')
+    return {'files': {}, 'scores': {}}
+
+
+def cached_file_hash(path, files):
+    """Content hash of a file, hashed again only if its size or mtime
+    changed since it was recorded in ``files``."""
+    path = osp.abspath(path)
+    stat = os.stat(path)
+    record = files.get(path)
+    if record is None or record[0] != stat.st_size or record[1] != stat.st_mtime_ns:
+        record = files[path] = [stat.st_size, stat.st_mtime_ns, file_hash(path)]
+    return record[2]
+
+
+def save_cache(cache, cache_path):
+    # atomic, so that an interrupted run never leaves a broken cache
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+def evaluate(result_folder, gt_folder, metric_opts, num_workers=4, cache_path=None, use_index=False):
+    """Score a folder of results against the GT folder.
+
+    Scores are cached per metric option and per (result, GT) content hash,
+    so only new or modified images are scored again. The hashes are cached
+    with the file size and mtime, so only touched or modified files are read
+    again. With several workers, LPIPS runs on the CPU, so that the workers do
+    not each load a network on the GPU.
+
+    Args:
+        result_folder (str): Folder of the restored images.
+        gt_folder (str): Folder of the GT images, with the same file names.
+        metric_opts (dict): Metric name to metric option.
+        num_workers (int): Number of worker processes. Default: 4.
+        cache_path (str | None): Path of the cache file. None for
+            ``{result_folder}_eval_cache.json``, next to the folder so that it
+            is never scanned as a result. Default: None.
+        use_index (bool): List the folders through the persistent directory
+            index. Default: False.
+
+    Returns:
+        list[dict]: Per-image results, with the keys 'name' and the metric
+            names.
+    """
+    if cache_path is None:
+        cache_path = f'{result_folder.rstrip("/")}_eval_cache.json'
+    cache = load_cache(cache_path)
+    paths = paired_paths_from_folder([result_folder, gt_folder], ['result', 'gt'], '{}', use_index=use_index)
+    opt_keys = {name: json.dumps(opt, sort_keys=True) for name, opt in metric_opts.items()}
+
+    lpips_device = 'cpu' if num_workers > 1 else None
+
+    records, tasks, pending = [], [], []
+    for path in paths:
+        result_hash = cached_file_hash(path['result_path'], cache['files'])
+        gt_hash = cached_file_hash(path['gt_path'], cache['files'])
+        cached = cache['scores'].setdefault(f'{result_hash}:{gt_hash}', {})
+        missing = {name: opt for name, opt in metric_opts.items() if opt_keys[name] not in cached}
+        record = {'name': osp.relpath(path['result_path'], result_folder)}
+        record.update({name: cached[opt_keys[name]] for name in metric_opts if name not in missing})
+        records.append(record)
+        if missing:
+            tasks.append((path['result_path'], path['gt_path'], missing, lpips_device))
+            pending.append((record, cached))
+    print(f'{len(paths)} image pairs, {len(tasks)} to be scored.')
+
+    if tasks:
+        if num_workers > 1:
+            # spawn, so that the workers never inherit a CUDA context
+            ctx = multiprocessing.get_context('spawn')
+            with ctx.Pool(num_workers, initializer=init_worker) as pool:
+                results = pool.imap(score_pair, tasks, chunksize=max(1, len(tasks) // (num_workers * 8)))
+                results = list(results)
+        else:
+            results = [score_pair(task) for task in tasks]
+        for (record, cached), scores in zip(pending, results):
+            record.update(scores)
+            cached.update({opt_keys[name]: score for name, score in scores.items()})
+    # also saves the refreshed stats of touched files
+    save_cache(cache, cache_path)
+    return records
+
+
+def write_csv(records, metric_names, csv_path):
+    """Write the per-image results and their means."""
+    means = {name: np.mean([record[name] for record in records]) for name in metric_names}
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name'] + list(metric_names))
+        for record in records:
+            writer.writerow([record['name']] + [f'{record[name]:.6f}' for name in metric_names])
+        writer.writerow(['mean'] + [f'{means[name]:.6f}' for name in metric_names])
+    return means
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--result_path', type=str, required=True, help='Folder of the restored images')
+    parser.add_argument('--gt_path', type=str, required=True, help='Folder of the GT images')
+    parser.add_argument('--metrics', type=str, nargs='+', default=['psnr', 'ssim'],
+                        help='Metrics among psnr, ssim and lpips')
+    parser.add_argument('--crop_border', type=int, default=0)
+    parser.add_argument('--test_y_channel', action='store_true')
+    parser.add_argument('--num_workers', type=int, default=4)
+    parser.add_argument('--csv', type=str, default=None, help='Output csv. Default: {result_path}_metrics.csv')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='Score cache. Default: {result_path}_eval_cache.json')
+    parser.add_argument('--dir_index', action='store_true',
+                        help='List the folders through a persistent directory index')
+
+    args = parser.parse_args()
+
+    if args.result_path.endswith('/'):  # solve when path ends with /
+        args.result_path = args.result_path[:-1]
+    csv_path = f'{args.result_path}_metrics.csv' if args.csv is None else args.csv
+
+    metric_opts = build_metric_opts(args.metrics, args.crop_border, args.test_y_channel)
+    records = evaluate(
+        args.result_path,
+        args.gt_path,
+        metric_opts,
+        num_workers=args.num_workers,
+        cache_path=args.cache,
+        use_index=args.dir_index)
+    means = write_csv(records, list(metric_opts.keys()), csv_path)
+
+    for name, value in means.items():
+        print(f'{name}: {value:.4f}')
+    print(f'\nPer-image results are saved in {csv_path}')
@@ -2,13 +2,24 @@ import os
 import cv2
 import argparse
 import glob
+import time
 import torch
-from basicsr.utils import imwrite, img2tensor, tensor2img, scandir
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from basicsr.utils import imwrite, img2tensor, scandir, load_checkpoint, TensorToImage
 import torch.nn.functional as F
 
+from basicsr.data.data_sampler import BucketBatchSampler, bucket_collate_fn
+from basicsr.utils.dir_index import DirectoryIndex, read_image_sizes
+from basicsr.utils.cpu_plan import apply_cpu_plan, get_cpu_topology, plan_cpu_execution
+from basicsr.utils.dist_util import get_dist_info, init_dist, shard_by_cost
+from basicsr.utils.result_cache import ResultCache, file_hash
 from basicsr.utils.registry import ARCH_REGISTRY
 import numpy as np
 
+DOWN_FACTOR = 8  # check_image_size
+NET_OPT = dict(channels=[32, 64, 64, 64], connection=False)
+
 
 def check_image_size(x, down_factor):
     _, _, h, w = x.size()
@@ -18,117 +29,309 @@ def check_image_size(x, down_factor):
     return x
 
 
-if __name__ == '__main__':
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    # device = 'cpu'
-    parser = argparse.ArgumentParser()
-
-    parser.add_argument('--test_path', type=str, default='.\\realblur_dataset_test')
-    parser.add_argument('--result_path', type=str, default='.\\result')
-
-    args = parser.parse_args()
-
-    # ------------------------ input & output ------------------------
-    if args.test_path.endswith('/'):  # solve when path ends with /
-        args.test_path = args.test_path[:-1]
-    if args.result_path.endswith('/'):  # solve when path ends with /
-        args.result_path = args.result_path[:-1]
-    result_root = f'{args.result_path}/{os.path.basename(args.test_path)}'
-
-    # ------------------ set up network -------------------
-    down_factor = 8 # check_image_size
-    net = ARCH_REGISTRY.get('Net')(channels=[32, 64, 64, 64], connection=False).to(device)
-
-    checkpoint = torch.load('.\weights1\\net.pth')['params']
-    net.load_state_dict(checkpoint)
+def prepare_input(img_path):
+    """Read an image and compute its normalized SNR map.
+
+    Returns:
+        tuple[Tensor]: Image (3, h, w) and SNR map (1, h, w).
+    """
+    img = cv2.imread(img_path, cv2.IMREAD_COLOR)
+    # prepare data
+    img_t = img2tensor(img / 255., bgr2rgb=True, float32=True)
+
+    # SNR map
+    img_nf = img_t.permute(1, 2, 0).numpy() * 255.0
+    img_nf = cv2.blur(img_nf, (5, 5))
+    img_nf = img_nf * 1.0 / 255.0
+    img_nf = torch.Tensor(img_nf).float().permute(2, 0, 1)
+
+    dark = img_t
+    dark = dark[0:1, :, :] * 0.299 + dark[1:2, :, :] * 0.587 + dark[2:3, :, :] * 0.114  # gray-scale
+    light = img_nf
+    light = light[0:1, :, :] * 0.299 + light[1:2, :, :] * 0.587 + light[2:3, :, :] * 0.114
+    noise = torch.abs(dark - light)  # noise map
+
+    mask = torch.div(light, noise + 0.0001)  # SNR map = clear map / noise map
+
+    height = mask.shape[1]
+    width = mask.shape[2]
+    mask_max = torch.max(mask.view(1, -1), dim=1)[0]
+    mask_max = mask_max.view(1, 1, 1)
+    mask_max = mask_max.repeat(1, height, width)
+    mask = mask * 1.0 / (mask_max + 0.0001)  # normalize its values to range [0, 1]
+
+    mask = torch.clamp(mask, min=0, max=1.0)
+    mask = mask.float()
+    return img_t, mask
+
+
+def image_areas(sizes):
+    """Image areas, used as the inference costs. Unknown sizes count as the
+    mean area."""
+    areas = [h * w for h, w in (size for size in sizes if size is not None)]
+    mean_area = sum(areas) / len(areas) if areas else 1
+    return [mean_area if size is None else size[0] * size[1] for size in sizes]
+
+
+def build_net(model_path, device, channels_last=False):
+    # build on the meta device to skip the random initialization, then take
+    # the memory-mapped weights as they are
+    with torch.device('meta'):
+        net = ARCH_REGISTRY.get('Net')(**NET_OPT, channels_last=channels_last)
+
+    checkpoint = load_checkpoint(model_path, param_key='params')
+    net.load_state_dict(checkpoint, assign=True)
+    # the assigned weights keep the layout of the checkpoint
+    net = net.to(device, memory_format=torch.channels_last if channels_last else torch.preserve_format)
     net.eval()
+    return net
 
-    # -------------------- start to processing ---------------------
-    # scan all the jpg and png images
-    img_paths = sorted(list(scandir(args.test_path, suffix=('jpg', 'png', 'bmp'), recursive=True, full_path=True)))
 
+def restore_images(net, img_paths, sizes, args, result_root, device, cache=None):
+    """Restore the images and save them under the result root. ``sizes``
+    are their (h, w), used for batching.
 
+    Returns:
+        ndarray: Inference time of each image, in ms.
+    """
     # --------------------  measure predicting time ---------------------
     # 预热, GPU 平时可能为了节能而处于休眠状态, 因此需要预热
     print('warm up ...\n')
 
-    # synchronize 等待所有 GPU 任务处理完才返回 CPU 主线程
-    torch.cuda.synchronize()
+    # CPU-only ranks fall back to a wall clock
+    cuda_timer = device.type == 'cuda'
+    if cuda_timer:
+        # synchronize 等待所有 GPU 任务处理完才返回 CPU 主线程
+        torch.cuda.synchronize()
 
-    # 设置用于测量时间的 cuda Event, 这是PyTorch 官方推荐的接口,理论上应该最靠谱
-    starter, ender = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+        # 设置用于测量时间的 cuda Event, 这是PyTorch 官方推荐的接口,理论上应该最靠谱
+        starter, ender = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
     # 初始化一个时间容器
     timings = np.zeros((len(img_paths), 1))
+    # post-processing with buffers reused across the images
+    to_image = TensorToImage(rgb2bgr=True, min_max=(0, 1))
     seq = 0
 
     print('testing ...\n')
     # ------------------------------------------------------------------
 
-    for img_path in img_paths:
-        img_name = img_path.replace(args.test_path+'/', '')
-        print(f'Processing: {img_name}')
-        img = cv2.imread(img_path, cv2.IMREAD_COLOR)
-        # prepare data
-        img_t = img2tensor(img / 255., bgr2rgb=True, float32=True)
+    # group images of the same padded size into batches
+    if args.batch_size > 1:
+        batches = list(BucketBatchSampler(sizes, args.batch_size, bucket_step=DOWN_FACTOR))
+    else:
+        batches = [[idx] for idx in range(len(img_paths))]
+
+    for batch_idx in batches:
+        batch = []
+        for idx in batch_idx:
+            img_name = img_paths[idx].replace(args.test_path+'/', '')
+            print(f'Processing: {img_name}')
+            img_t, mask = prepare_input(img_paths[idx])
+            batch.append({'lq': img_t, 'mask': mask})
+
+        if len(batch) == 1:
+            # check_image_size
+            ori_size = [batch[0]['lq'].shape[1:]]
+            img_t = check_image_size(batch[0]['lq'].unsqueeze(0), DOWN_FACTOR).to(device)
+            mask = batch[0]['mask'].unsqueeze(0).to(device)
+        else:
+            # pad to the common size of the bucket, and crop back per image
+            batch = bucket_collate_fn(batch, size_divisor=DOWN_FACTOR)
+            ori_size = batch['ori_size'].tolist()
+            img_t, mask = batch['lq'].to(device), batch['mask'].to(device)
+
+        # inference
+        with torch.no_grad():
+            # --------------------  measure predicting time ---------------------
+            if cuda_timer:
+                starter.record()
+            else:
+                start_time = time.perf_counter()
+
+            output_t = net(img_t, mask)
 
-        # SNR map
-        img_nf = img_t.permute(1, 2, 0).numpy() * 255.0
-        img_nf = cv2.blur(img_nf, (5, 5))
-        img_nf = img_nf * 1.0 / 255.0
-        img_nf = torch.Tensor(img_nf).float().permute(2, 0, 1)
+            if cuda_timer:
+                ender.record()
+                torch.cuda.synchronize()  # 等待GPU任务完成
+                curr_time = starter.elapsed_time(ender)  # 从 starter 到 ender 之间用时,单位为毫秒
+            else:
+                curr_time = (time.perf_counter() - start_time) * 1000
+            # the time of a batch is shared by its images
+            timings[seq:seq + len(batch_idx)] = curr_time / len(batch_idx)
+            seq += len(batch_idx)
+            # ------------------------------------------------------------------
 
-        dark = img_t
-        dark = dark[0:1, :, :] * 0.299 + dark[1:2, :, :] * 0.587 + dark[2:3, :, :] * 0.114  # gray-scale
-        light = img_nf
-        light = light[0:1, :, :] * 0.299 + light[1:2, :, :] * 0.587 + light[2:3, :, :] * 0.114
-        noise = torch.abs(dark - light)  # noise map
+        for i, idx in enumerate(batch_idx):
+            H, W = ori_size[i]
+            output = to_image(output_t[i, :, :H, :W])
 
-        mask = torch.div(light, noise + 0.0001)  # SNR map = clear map / noise map
+            # save restored img
+            save_restore_path = img_paths[idx].replace(args.test_path, result_root)
+            imwrite(output, save_restore_path)
+            if cache is not None:
+                cache.add(img_paths[idx])
+        if cache is not None:
+            cache.flush()
 
-        height = mask.shape[1]
-        width = mask.shape[2]
-        mask_max = torch.max(mask.view(1, -1), dim=1)[0]
-        mask_max = mask_max.view(1, 1, 1)
-        mask_max = mask_max.repeat(1, height, width)
-        mask = mask * 1.0 / (mask_max + 0.0001)  # normalize its values to range [0, 1]
+        # keep the cached blocks: the next batch reuses them for padding and
+        # the network activations
+        del output_t
 
-        mask = torch.clamp(mask, min=0, max=1.0)
-        mask = mask.float()
-        mask = mask.unsqueeze(0).to(device)
+    return timings
 
-        img_t = img_t.unsqueeze(0).to(device)
 
-        # inference
-        with torch.no_grad():
-            # check_image_size
-            H, W = img_t.shape[2:]
-            img_t = check_image_size(img_t, down_factor)
+def cpu_worker(worker_id, plan, shards, size_shards, args, result_root, model_path, cache, rank, timings_queue):
+    """Run one worker of a CPU plan, spawned by ``torch.multiprocessing``."""
+    apply_cpu_plan(plan, worker_id)
+    net = build_net(model_path, torch.device('cpu'), args.channels_last)
+    if cache is not None:
+        cache.open(f'{rank}.{worker_id}')
+    timings = restore_images(
+        net, shards[worker_id], size_shards[worker_id], args, result_root, torch.device('cpu'), cache)
+    if cache is not None:
+        cache.close()
+    timings_queue.put(timings)
 
-            # --------------------  measure predicting time ---------------------
-            starter.record()
 
-            output_t = net(img_t, mask)
+if __name__ == '__main__':
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    # device = 'cpu'
+    parser = argparse.ArgumentParser()
 
-            ender.record()
-            torch.cuda.synchronize()  # 等待GPU任务完成
-            curr_time = starter.elapsed_time(ender)  # 从 starter 到 ender 之间用时,单位为毫秒
-            timings[seq] = curr_time
-            seq += 1
-            # ------------------------------------------------------------------
+    parser.add_argument('--test_path', type=str, default='.\\realblur_dataset_test')
+    parser.add_argument('--result_path', type=str, default='.\\result')
+    parser.add_argument('--dir_index', action='store_true',
+                        help='List test_path through a persistent directory index')
+    parser.add_argument('--batch_size', type=int, default=1,
+                        help='Batch images of the same padded size together')
+    parser.add_argument('--launcher', choices=['none', 'pytorch', 'slurm'], default='none',
+                        help='Shard the images across the ranks of a distributed job')
+    parser.add_argument('--backend', type=str, default=None,
+                        help='Distributed backend. Default: nccl with GPUs, gloo otherwise')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Process all the images, even those with a valid cached result')
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help='Folder of the result cache. Default: the result folder, as hidden files')
+    parser.add_argument('--channels_last', action='store_true',
+                        help='Run the network in channels_last (NHWC) memory format')
+    parser.add_argument('--cpu_workers', type=int, default=None,
+                        help='Worker processes for CPU inference. Default: planned from the image size and cores')
+    parser.add_argument('--cpu_threads', type=int, default=None,
+                        help='Intra-op threads per CPU worker. Default: planned from the image size and cores')
 
-            output_t = output_t[:,:,:H,:W]
-            output = tensor2img(output_t, rgb2bgr=True, min_max=(0, 1))
+    args = parser.parse_args()
 
-        del output_t
-        torch.cuda.empty_cache()
+    # ------------------------ distributed ------------------------
+    if args.launcher != 'none':
+        backend = args.backend or ('nccl' if torch.cuda.is_available() else 'gloo')
+        init_dist(args.launcher, backend=backend)
+    rank, world_size = get_dist_info()
 
-        output = output.astype('uint8')
+    # ------------------------ input & output ------------------------
+    if args.test_path.endswith('/'):  # solve when path ends with /
+        args.test_path = args.test_path[:-1]
+    if args.result_path.endswith('/'):  # solve when path ends with /
+        args.result_path = args.result_path[:-1]
+    result_root = f'{args.result_path}/{os.path.basename(args.test_path)}'
 
-        # save restored img
-        save_restore_path = img_path.replace(args.test_path, result_root)
-        imwrite(output, save_restore_path)
+    model_path = '.\weights1\\net.pth'
 
+    # -------------------- start to processing ---------------------
+    # scan all the jpg and png images
+    # the directory index also serves the image sizes
+    index = None
+    if args.dir_index:
+        index = DirectoryIndex(args.test_path)
+        img_paths = sorted(
+            os.path.join(args.test_path, img_path)
+            for img_path in index.scan(suffix=('jpg', 'png', 'bmp'), recursive=True))
+        index.save()
+    else:
+        img_paths = sorted(list(scandir(args.test_path, suffix=('jpg', 'png', 'bmp'), recursive=True, full_path=True)))
+
+    # skip the images whose cached result is still valid
+    num_images = len(img_paths)
+    cache = None
+    if not args.no_cache:
+        # everything the outputs depend on, besides the input content
+        settings = dict(
+            checkpoint=file_hash(model_path),
+            net=dict(type='Net', channels_last=args.channels_last, **NET_OPT),
+            down_factor=DOWN_FACTOR,
+            batch_size=args.batch_size)
+        # rank 0 validates the cache and compacts the journals of the last
+        # run before any rank opens its own journal
+        if rank == 0:
+            cache = ResultCache(args.test_path, result_root, settings, cache_dir=args.cache_dir)
+            img_paths = [img_path for img_path in img_paths if not cache.is_done(img_path)]
+            cache.compact()
+        if world_size > 1:
+            dist.barrier()
+        if rank != 0:
+            cache = ResultCache(args.test_path, result_root, settings, cache_dir=args.cache_dir)
+            img_paths = [img_path for img_path in img_paths if not cache.is_done(img_path)]
+        if rank == 0:
+            print(f'{num_images} images, {num_images - len(img_paths)} cached.\n')
+
+    # read the sizes once, for the sharding, the CPU plan and the batching
+    if world_size > 1 or device.type == 'cpu' or args.batch_size > 1:
+        sizes = read_image_sizes(img_paths, index)
+    else:
+        sizes = [None] * len(img_paths)
+
+    # balance the images by area across ranks
+    if world_size > 1:
+        shards = shard_by_cost(image_areas(sizes), world_size)
+        img_paths = [img_paths[idx] for idx in shards[rank]]
+        sizes = [sizes[idx] for idx in shards[rank]]
+
+    # ------------------------ restore ------------------------
+    start_time = time.perf_counter()
+    if device.type == 'cpu':
+        # split the cores of the host between its local ranks
+        local_size = int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+        local_rank = int(os.environ.get('LOCAL_RANK', 0))
+        sockets = get_cpu_topology()
+        if local_size > 1:
+            cpus = [cpu for socket in sockets for cpu in socket]
+            chunk = max(len(cpus) // local_size, 1)
+            sockets = [cpus[local_rank * chunk:(local_rank + 1) * chunk] or cpus[-chunk:]]
+        plan = plan_cpu_execution(
+            image_areas(sizes), sockets, num_workers=args.cpu_workers, num_threads=args.cpu_threads)
+        print(f'CPU plan: {plan.num_workers} worker(s) x {plan.num_threads} thread(s), cpus {plan.cpus}\n')
+    if device.type == 'cpu' and plan.num_workers > 1:
+        shards = shard_by_cost(image_areas(sizes), plan.num_workers)
+        size_shards = [[sizes[idx] for idx in shard] for shard in shards]
+        shards = [[img_paths[idx] for idx in shard] for shard in shards]
+        timings_queue = mp.get_context('spawn').SimpleQueue()
+        context = mp.spawn(
+            cpu_worker,
+            args=(plan, shards, size_shards, args, result_root, model_path, cache, rank, timings_queue),
+            nprocs=plan.num_workers,
+            join=False)
+        # drain the queue while joining, so that no worker blocks on a full
+        # pipe, and the error of a failed worker is raised instead of waiting
+        # for its timings forever
+        timings = []
+        while True:
+            done = context.join(timeout=1)
+            while not timings_queue.empty():
+                timings.append(timings_queue.get())
+            if done:
+                break
+        timings = np.concatenate(timings)
+    else:
+        if device.type == 'cpu':
+            apply_cpu_plan(plan)
+        net = build_net(model_path, device, args.channels_last)
+        if cache is not None:
+            cache.open(rank)
+        timings = restore_images(net, img_paths, sizes, args, result_root, device, cache)
+        if cache is not None:
+            cache.close()
+    elapsed = time.perf_counter() - start_time
     print(f'\nAll results are saved in {result_root}')
+    print(f'{len(img_paths)} images in {elapsed:.1f}s, {len(img_paths) / max(elapsed, 1e-9):.2f} images/s')
 
-    avg = timings.sum() / len(img_paths)
+    avg = timings.sum() / max(len(img_paths), 1)
     print('\navg={}\n'.format(avg))
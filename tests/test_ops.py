@@ -0,0 +1,87 @@
+"""Parity of the pure PyTorch ops (used on CPU or without the compiled
+extensions) with reference implementations."""
+import numpy as np
+import pytest
+import torch
+
+from basicsr.ops.dcn import deform_conv_native
+from basicsr.ops.fused_act.fused_act import fused_leaky_relu_native
+from basicsr.ops.upfirdn2d.upfirdn2d import upfirdn2d_native
+
+
+@pytest.mark.parametrize('size', [(1, 1), (1, 7), (6, 1), (5, 7), (9, 8)])
+@pytest.mark.parametrize('modulated', [False, True])
+@pytest.mark.parametrize('stride, padding, dilation, groups, deformable_groups', [
+    (1, 1, 1, 1, 1),
+    (2, 0, 1, 2, 2),
+    (1, 2, 2, 1, 4),
+])
+def test_deform_conv_native(size, modulated, stride, padding, dilation, groups, deformable_groups):
+    torchvision = pytest.importorskip('torchvision')
+    torch.manual_seed(0)
+    h, w = size
+    c, c_out, k = 4, 6, 3
+    h_out = (h + 2 * padding - dilation * (k - 1) - 1) // stride + 1
+    w_out = (w + 2 * padding - dilation * (k - 1) - 1) // stride + 1
+    if h_out < 1 or w_out < 1:
+        pytest.skip('empty output')
+    x = torch.randn(2, c, h, w, dtype=torch.float64)
+    # large offsets, so that many samples fall outside the image
+    offset = torch.randn(2, deformable_groups * 2 * k * k, h_out, w_out, dtype=torch.float64) * 2
+    mask = torch.rand(2, deformable_groups * k * k, h_out, w_out, dtype=torch.float64) if modulated else None
+    weight = torch.randn(c_out, c // groups, k, k, dtype=torch.float64)
+    bias = torch.randn(c_out, dtype=torch.float64)
+
+    out = deform_conv_native(x, offset, mask, weight, bias, stride, padding, dilation, groups, deformable_groups)
+    ref = torchvision.ops.deform_conv2d(
+        x, offset, weight, bias, stride=stride, padding=padding, dilation=dilation, mask=mask)
+    torch.testing.assert_close(out, ref, rtol=1e-10, atol=1e-10)
+
+
+def test_fused_leaky_relu_native():
+    torch.manual_seed(0)
+    x = torch.randn(2, 5, 4, 3, dtype=torch.float64)
+    bias = torch.randn(5, dtype=torch.float64)
+    out = fused_leaky_relu_native(x, bias, negative_slope=0.2, scale=2**0.5)
+
+    v = x.numpy() + bias.numpy()[None, :, None, None]
+    ref = np.where(v >= 0, v, v * 0.2) * 2**0.5
+    np.testing.assert_allclose(out.numpy(), ref, rtol=1e-12, atol=1e-12)
+
+
+def _upfirdn2d_reference(x, kernel, up, down, pad):
+    """Upsample by zero insertion, pad (crop if negative), convolve with the
+    kernel and downsample, by definition."""
+    n, c, h, w = x.shape
+    pad_x0, pad_x1, pad_y0, pad_y1 = pad
+    up_img = np.zeros((n, c, h * up, w * up))
+    up_img[:, :, ::up, ::up] = x
+    padded = np.pad(up_img, ((0, 0), (0, 0), (max(pad_y0, 0), max(pad_y1, 0)), (max(pad_x0, 0), max(pad_x1, 0))))
+    padded = padded[:, :, max(-pad_y0, 0):padded.shape[2] - max(-pad_y1, 0),
+                    max(-pad_x0, 0):padded.shape[3] - max(-pad_x1, 0)]
+    kh, kw = kernel.shape
+    flipped = kernel[::-1, ::-1]
+    out_h = (padded.shape[2] - kh) // down + 1
+    out_w = (padded.shape[3] - kw) // down + 1
+    out = np.zeros((n, c, out_h, out_w))
+    for y in range(out_h):
+        for x_ in range(out_w):
+            window = padded[:, :, y * down:y * down + kh, x_ * down:x_ * down + kw]
+            out[:, :, y, x_] = (window * flipped).sum(axis=(2, 3))
+    return out
+
+
+@pytest.mark.parametrize('up, down, pad', [
+    (1, 1, (1, 1, 1, 1)),
+    (2, 1, (2, 1, 2, 1)),
+    (1, 2, (1, 1, 1, 1)),
+    (2, 2, (-1, 2, 0, -1)),
+])
+def test_upfirdn2d_native(up, down, pad):
+    torch.manual_seed(0)
+    x = torch.randn(2, 3, 7, 6, dtype=torch.float64)
+    kernel = torch.randn(4, 3, dtype=torch.float64)
+    out = upfirdn2d_native(x, kernel, up, up, down, down, *pad)
+
+    ref = _upfirdn2d_reference(x.numpy(), kernel.numpy(), up, down, pad)
+    np.testing.assert_allclose(out.numpy(), ref, rtol=1e-10, atol=1e-10)